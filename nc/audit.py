@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+
+AUDIT_DIR = Path(".nc/audit")
+AUDIT_CACHE = AUDIT_DIR / "cache.json"
+
+
+def collect_files(pattern: str):
+    """Files matching a glob (``**`` recurses), skipping hidden dirs and .nc itself."""
+    files = []
+    for p in sorted(Path(".").glob(pattern)):
+        if not p.is_file():
+            continue
+        if any(part.startswith(".") for part in p.parts[:-1]):
+            continue
+        files.append(p.resolve())
+    return files
+
+
+def load_cache():
+    if not AUDIT_CACHE.exists():
+        return {}
+    with open(AUDIT_CACHE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_cache(cache):
+    AUDIT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(AUDIT_CACHE, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+
+
+def write_report(results, stamp: str):
+    """Writes the audit results as JSON and Markdown; returns both paths."""
+    AUDIT_DIR.mkdir(parents=True, exist_ok=True)
+    json_path = AUDIT_DIR / f"report-{stamp}.json"
+    md_path = AUDIT_DIR / f"report-{stamp}.md"
+
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    counts = {s: sum(1 for r in results if r["status"] == s) for s in ("issues", "clean", "error")}
+    lines = [
+        f"# nc audit {stamp}",
+        "",
+        f"{len(results)} files: {counts['issues']} with issues, {counts['clean']} clean, {counts['error']} failed.",
+        "",
+    ]
+    for r in results:
+        if r["status"] == "clean":
+            continue
+        # Findings already carry the model's fenced fix diff, if any
+        lines += [f"## {r['path']} ({r['status']}{', cached' if r['cached'] else ''})", "", r["findings"].strip(), ""]
+    md_path.write_text("\n".join(lines), encoding="utf-8")
+    return json_path, md_path
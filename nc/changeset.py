@@ -0,0 +1,128 @@
+import json
+import hashlib
+from datetime import datetime, UTC
+from pathlib import Path
+
+from .diff_utils import patch_text
+from .history import record_revision, list_revisions, revert_revisions
+
+# The changeset generated by the last `edit --files`
+CHANGESET_FILE = Path(".nc/changeset.json")
+# Applied changesets, newest last; `revert --changeset` undoes the last one
+CHANGESET_LOG = Path(".nc/changesets.json")
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write(path: Path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def _load_log():
+    if not CHANGESET_LOG.exists():
+        return []
+    with open(CHANGESET_LOG, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(instruction: str, entries):
+    """Stores per-file diffs as the pending changeset.
+
+    `entries` are {"path", "diff", "score", "reason"}; each also records the
+    hash of its file now, so a later apply can tell the file moved on.
+    """
+    changeset = {
+        "id": datetime.now(UTC).strftime("%Y%m%dT%H%M%SZ"),
+        "instruction": instruction,
+        "applied": None,
+        "files": [{**e, "base": _sha(Path(e["path"]).read_bytes())} for e in entries],
+    }
+    _write(CHANGESET_FILE, changeset)
+    return changeset
+
+
+def load():
+    if not CHANGESET_FILE.exists():
+        return None
+    with open(CHANGESET_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def apply(changeset):
+    """Applies every diff of `changeset` or none of them; returns the patched paths.
+
+    All hunks are matched in memory before anything is written. Each file
+    gets a revision in its history, and the changeset is logged for
+    `revert`; if a write, a revision or the log fails, every file is put
+    back and the revisions already recorded are dropped.
+    """
+    if changeset["applied"]:
+        raise ValueError("this changeset is already applied; 'revert --changeset' undoes it.")
+
+    originals, patched = {}, {}
+    for entry in changeset["files"]:
+        path = Path(entry["path"])
+        raw = path.read_bytes()
+        if _sha(raw) != entry["base"]:
+            raise ValueError(f"{path.name} changed since the changeset was generated; run 'edit --files' again.")
+        try:
+            patched[path] = patch_text(entry["diff"], raw.decode("utf-8"))
+        except ValueError as e:
+            raise ValueError(f"{path.name}: {e}") from e
+        originals[path] = raw
+
+    message = f"changeset {changeset['id']}: {changeset['instruction']}"
+    written, after = [], {}
+    try:
+        for path, text in patched.items():
+            path.write_text(text, encoding="utf-8")
+            written.append(path)
+        for path in written:
+            after[str(path)] = record_revision(path, originals[path], message)["after"]
+        log = _load_log()
+        log.append({"id": changeset["id"], "instruction": changeset["instruction"], "files": after})
+        _write(CHANGESET_LOG, log)
+    except Exception:
+        for path in written:
+            if str(path) in after:
+                # Restores the file and drops its revision in one step
+                revert_revisions(path, 1)
+            else:
+                path.write_bytes(originals[path])
+        raise
+
+    changeset["applied"] = datetime.now(UTC).isoformat()
+    _write(CHANGESET_FILE, changeset)
+    return list(patched)
+
+
+def revert():
+    """Undoes the last applied changeset in every file; returns its log entry.
+
+    Every file is checked before any is touched: each must still be exactly
+    as the changeset left it, with the changeset as its latest revision.
+    """
+    log = _load_log()
+    if not log:
+        raise ValueError("no applied changeset to revert")
+    last = log[-1]
+
+    for name, after in last["files"].items():
+        path = Path(name)
+        revisions = list_revisions(path)
+        if not revisions or revisions[-1]["after"] != after or _sha(path.read_bytes()) != after:
+            raise ValueError(f"{path.name} changed since changeset {last['id']} was applied; refusing to revert.")
+
+    for name in last["files"]:
+        revert_revisions(Path(name), 1)
+    _write(CHANGESET_LOG, log[:-1])
+
+    pending = load()
+    if pending and pending["id"] == last["id"]:
+        pending["applied"] = None
+        _write(CHANGESET_FILE, pending)
+    return last
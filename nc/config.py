@@ -1,12 +1,80 @@
+import os
+import shutil
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-LLAMA_SERVER_BIN = "C:/llama/llama-server.exe"
-MODEL_PATH = str(BASE_DIR / "models" / "qwen2.5-coder-3b-instruct-q4_k_m.gguf")
+LLAMA_SERVER_BIN = os.environ.get("NC_LLAMA_SERVER") or shutil.which("llama-server") or "C:/llama/llama-server.exe"
+MODEL_PATH = os.environ.get("NC_MODEL_PATH") or str(BASE_DIR / "models" / "qwen2.5-coder-3b-instruct-q4_k_m.gguf")
 
 TEMPERATURE = 0.0
 TOP_P = 1.0
 SEED = 42
 MAX_TOKENS = 4096
 CONTEXT_SIZE = 8192
+
+# llama-server slots, each with its own context window; every slot costs a full
+# window of KV cache, so servers run one unless NC_SLOTS (or a profile) asks for more
+SERVER_SLOTS = int(os.environ.get("NC_SLOTS", "1"))
+# Most requests a best-of, changeset or audit run keeps in flight; the server is
+# relaunched with that many slots for it
+PARALLEL_SLOTS = 4
+# Seconds a model request may take, waiting for a free slot included
+REQUEST_TIMEOUT = 300
+# `edit --best N`: candidate i samples at TEMPERATURE + i * BEST_OF_TEMP_STEP
+BEST_OF_TEMP_STEP = 0.15
+
+# `watch`: seconds between checks for saved files
+WATCH_INTERVAL = 0.5
+
+# Minimum share of a hunk's non-blank old lines that must match for a fuzzy apply
+FUZZ_THRESHOLD = 0.75
+
+# fix/explain re-send the whole file once more than this share of functions changed
+INCREMENTAL_MAX_CHANGED = 0.5
+
+# Chat turns sent back to the model as history (the full log is kept on disk)
+CHAT_HISTORY_LIMIT = 20
+# Entries per page in show-chat / show-plans
+PAGE_SIZE = 5
+
+# `python -m nc.importtime` fails when `import nc` takes longer than this
+IMPORT_BUDGET_MS = 50
+
+# Files covered by the workspace-wide semantic search index
+SEARCH_GLOB = "**/*.py"
+
+# Hits shown per search, and chunks sent per /embedding request
+SEARCH_TOP_K = 5
+EMBED_BATCH = 16
+
+# ask/explain/search/plan send files without comments, blank lines and docstring
+# bodies; line numbers in answers are mapped back (NC_MINIFY=1 to enable)
+MINIFY_CONTEXT = os.environ.get("NC_MINIFY") == "1"
+
+# run-plan applies a step automatically only at or above this verifier score
+PLAN_MIN_SCORE = 60
+
+# After `open`, prefill the file, count its tokens, refresh the search index and
+# pre-generate `explain` while the shell is idle (NC_PRECOMPUTE=1 to enable)
+PRECOMPUTE_ON_OPEN = os.environ.get("NC_PRECOMPUTE") == "1"
+
+# The shell stops the llama-servers it launched after this many idle seconds;
+# the next command restarts them (0 keeps them running until `exit`)
+SERVER_IDLE_TIMEOUT = 15 * 60
+# Servers relaunched with extra slots for a parallel run are stopped sooner, after
+# this many idle seconds, to give that KV cache back; the next command starts them
+# at the usual size (0 leaves them to SERVER_IDLE_TIMEOUT)
+SERVER_SHRINK_TIMEOUT = 2 * 60
+
+# Per-slot context is sized to each request, in powers of two between these
+MIN_CONTEXT_SIZE = 4096
+MAX_CONTEXT_SIZE = 32768
+
+# `apply --test`: impacted tests run in up to TEST_WORKERS pytest processes, each
+# stopped after TEST_TIMEOUT seconds; a failure reverts the apply (NC_TEST_ON_APPLY=1
+# runs them after every apply)
+TEST_GLOBS = ("**/test_*.py", "**/*_test.py")
+TEST_WORKERS = 4
+TEST_TIMEOUT = 120
+TEST_ON_APPLY = os.environ.get("NC_TEST_ON_APPLY") == "1"
@@ -2,6 +2,19 @@ import re
 import difflib
 from pathlib import Path
 
+from .config import FUZZ_THRESHOLD
+
+# Extra file lines searched on each side of a candidate hunk position
+FUZZ_SLACK = 3
+FUZZ_CANDIDATES = 5
+
+PLACEHOLDERS = (
+    "removed line", "added line", "context line",
+    "old code", "new code", "snippet here",
+    "implementation here", "your code here",
+)
+PLACEHOLDER_RE = re.compile("|".join(re.escape(p) for p in PLACEHOLDERS), re.IGNORECASE)
+
 def generate_diff(old_text: str, new_text: str, filename: str = "FILE") -> str:
     """Generates a unified diff between old_text and new_text."""
     old_lines = old_text.splitlines(keepends=True)
@@ -18,9 +31,10 @@ def generate_diff(old_text: str, new_text: str, filename: str = "FILE") -> str:
 
 def validate_unified_diff(diff_text: str) -> str:
     """Extracts diff from markdown and validates structure."""
-    match = re.search(r"```(?:diff)?\n(.*?)\n```", diff_text, re.DOTALL)
-    if match:
-        diff_text = match.group(1)
+    if "```" in diff_text:
+        match = re.search(r"```(?:diff)?\n(.*?)\n```", diff_text, re.DOTALL)
+        if match:
+            diff_text = match.group(1)
 
     lines = diff_text.splitlines()
     
@@ -32,13 +46,7 @@ def validate_unified_diff(diff_text: str) -> str:
     final_diff = "\n".join(lines[start_idx:]).strip()
     
     # Check for lazy placeholders
-    check_text = final_diff.lower()
-    placeholders = [
-        "removed line", "added line", "context line", 
-        "old code", "new code", "snippet here", 
-        "implementation here", "your code here"
-    ]
-    if any(p in check_text for p in placeholders):
+    if PLACEHOLDER_RE.search(final_diff):
         raise ValueError("Model returned a placeholder template instead of actual code.")
 
     if "@@ " not in final_diff: 
@@ -55,12 +63,84 @@ def validate_unified_diff(diff_text: str) -> str:
     return final_diff
 
 
-def apply_diff(diff_content: str, target: Path):
-    """Applies a unified diff to a target file."""
-    if not target.exists():
-        raise FileNotFoundError(f"Target file {target} does not exist.")
-
-    target_text = target.read_text(encoding="utf-8")
+def _fuzzy_hunk(file_lines, hunk_lines, expected):
+    """Aligns a hunk whose context drifted from the file, like patch's fuzz factor.
+
+    Candidate positions are voted for by every non-blank old line that occurs in
+    the file; each candidate window is then aligned with SequenceMatcher. All
+    removed lines must match; unmatched context lines count as fuzz.
+    Returns (start, end, new_lines, fuzz, confidence) or None.
+    """
+    old = [(l[0], l[1:]) for l in hunk_lines if not l.startswith("+")]
+    old_keys = [text.strip() for _, text in old]
+    file_keys = [l.strip() for l in file_lines]
+
+    positions = {}
+    for j, key in enumerate(file_keys):
+        if key:
+            positions.setdefault(key, []).append(j)
+    votes = {}
+    for k, key in enumerate(old_keys):
+        for j in positions.get(key, ()) if key else ():
+            votes[j - k] = votes.get(j - k, 0) + 1
+    if not votes:
+        return None
+
+    nonblank = sum(1 for key in old_keys if key) or 1
+    slack = FUZZ_SLACK + len(old) // 4
+    best = None
+    # Most-voted starts first, nearest to the header's line number on ties
+    for start in sorted(votes, key=lambda s: (-votes[s], abs(s - expected)))[:FUZZ_CANDIDATES]:
+        lo, hi = max(0, start - slack), min(len(file_lines), start + len(old) + slack)
+        matcher = difflib.SequenceMatcher(None, old_keys, file_keys[lo:hi], autojunk=False)
+        mapping = {}
+        for a, b, size in matcher.get_matching_blocks():
+            for n in range(size):
+                mapping[a + n] = lo + b + n
+        if any(tag == "-" and k not in mapping for k, (tag, _) in enumerate(old)):
+            continue
+
+        matched = sum(1 for k in mapping if old_keys[k])
+        confidence = matched / nonblank
+        if confidence < FUZZ_THRESHOLD:
+            continue
+        if best is None or confidence > best[0]:
+            best = (confidence, mapping)
+
+    if best is None:
+        return None
+    confidence, mapping = best
+
+    # Rebuild only the span between the first and last matched line, keeping
+    # file lines the hunk doesn't mention and dropping context it got wrong.
+    first, last = min(mapping.values()), max(mapping.values())
+    out, cursor, pending, k = [], first, [], 0
+    for line in hunk_lines:
+        if line.startswith("+"):
+            (out if cursor > first else pending).append(line[1:])
+            continue
+        idx = mapping.get(k)
+        k += 1
+        if idx is None:
+            continue
+        out.extend(file_lines[cursor:idx])
+        out.extend(pending)
+        pending = []
+        if line.startswith(" "):
+            out.append(file_lines[idx])
+        cursor = idx + 1
+    out.extend(pending)
+
+    fuzz = sum(1 for k, (tag, _) in enumerate(old) if tag == " " and k not in mapping)
+    return first, last + 1, out, fuzz, confidence
+
+
+def patch_text(diff_content: str, target_text: str, report=None) -> str:
+    """Applies a unified diff to text in memory and returns the patched text.
+
+    If `report` is a list, one dict per hunk is appended describing where it
+    landed: method, offset from the header's line number, fuzz and confidence.
+    """
     target_lines = target_text.splitlines()
 
     # Parse hunks
@@ -97,12 +177,12 @@ def apply_diff(diff_content: str, target: Path):
         search_lines = [l[1:] for l in hunk["lines"] if not l.startswith("+")]
         replacement_lines = [l[1:] for l in hunk["lines"] if not l.startswith("-")]
         
-        found_idx = -1
+        found_idx, method = -1, None
         
         # 1. Try exact match
         for i in range(len(new_content_lines) - len(search_lines) + 1):
             if all(new_content_lines[i+j] == search_lines[j] for j in range(len(search_lines))):
-                found_idx = i
+                found_idx, method = i, "exact"
                 break
         
         # 2. Try match with stripped whitespace to go easy
@@ -110,7 +190,7 @@ def apply_diff(diff_content: str, target: Path):
             for i in range(len(new_content_lines) - len(search_lines) + 1):
                 if all(new_content_lines[i+j].strip() == search_lines[j].strip() for j in range(len(search_lines))):
                     if any(search_lines[j].strip() for j in range(len(search_lines))):
-                        found_idx = i
+                        found_idx, method = i, "whitespace"
                         break
         
         # 3. Handle EOF issue
@@ -120,11 +200,36 @@ def apply_diff(diff_content: str, target: Path):
                 # Check for exact match at the very end of file
                 start_at = len(new_content_lines) - len(short_search)
                 if all(new_content_lines[start_at+j] == short_search[j] for j in range(len(short_search))):
-                    found_idx = start_at
+                    found_idx, method = start_at, "eof"
 
-        if found_idx == -1:
-            raise ValueError(f"Hunk starting at line {hunk['old_start']} failed to apply (content not found).")
+        expected = hunk["old_start"] - 1
+        if found_idx != -1:
+            end_idx, fuzz, confidence = found_idx + len(search_lines), 0, 1.0
+        else:
+            # 4. Fuzzy structural alignment for drifted context
+            fuzzy = _fuzzy_hunk(new_content_lines, hunk["lines"], expected)
+            if fuzzy is None:
+                raise ValueError(f"Hunk starting at line {hunk['old_start']} failed to apply (content not found).")
+            found_idx, end_idx, replacement_lines, fuzz, confidence = fuzzy
+            method = "fuzzy"
 
-        new_content_lines[found_idx : found_idx + len(search_lines)] = replacement_lines
+        if report is not None:
+            report.append({
+                "line": hunk["old_start"], "method": method, "offset": found_idx - expected,
+                "fuzz": fuzz, "confidence": round(confidence, 2),
+            })
+
+        new_content_lines[found_idx : end_idx] = replacement_lines
+
+    return "\n".join(new_content_lines) + "\n"
+
+
+def apply_diff(diff_content: str, target: Path):
+    """Applies a unified diff to a target file and returns the per-hunk report."""
+    if not target.exists():
+        raise FileNotFoundError(f"Target file {target} does not exist.")
 
-    target.write_text("\n".join(new_content_lines) + "\n", encoding="utf-8")
\ No newline at end of file
+    report = []
+    new_text = patch_text(diff_content, target.read_text(encoding="utf-8"), report)
+    target.write_text(new_text, encoding="utf-8")
+    return list(reversed(report))
\ No newline at end of file
@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .symbols import code_units, module_residue
+from .config import EMBED_BATCH
+
+INDEX_DIR = Path(".nc/embeddings")
+META_FILE = INDEX_DIR / "index.json"
+VECTORS_FILE = INDEX_DIR / "vectors.npy"
+
+# Files that don't parse are split into fixed windows instead of AST units
+WINDOW_LINES = 40
+# Keeps a chunk inside a small embedding model's context
+CHUNK_MAX_CHARS = 4000
+
+
+def available() -> bool:
+    return np is not None
+
+
+def chunk_file(path: Path, text: str):
+    """Chunks on function/method boundaries, plus one chunk for module-level code."""
+    lines = text.splitlines()
+    units = code_units(text) if path.suffix == ".py" else None
+    spans = []
+    if units is not None:
+        covered = set()
+        for u in units:
+            if u["name"] != "<module>":
+                spans.append((u["name"], u["line"], u["end"], "\n".join(lines[u["line"] - 1:u["end"]])))
+                covered.update(range(u["line"], u["end"] + 1))
+        rest = module_residue(lines, covered)
+        if rest:
+            spans.append(("<module>", 1, len(lines), rest))
+    else:
+        for start in range(0, len(lines), WINDOW_LINES):
+            end = min(start + WINDOW_LINES, len(lines))
+            spans.append((f"lines {start + 1}-{end}", start + 1, end, "\n".join(lines[start:end])))
+
+    chunks = []
+    for name, line, end, source in spans:
+        # The path and name go into the embedded text: they carry a lot of the meaning
+        body = f"# {path.as_posix()}: {name}\n{source}"[:CHUNK_MAX_CHARS]
+        chunks.append({
+            "file": path.as_posix(), "name": name, "line": line, "end": end,
+            "hash": hashlib.sha256(body.encode()).hexdigest(), "text": body,
+        })
+    return chunks
+
+
+def _load(model):
+    if not (META_FILE.exists() and VECTORS_FILE.exists()):
+        return [], None
+    with open(META_FILE, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("model") != model:
+        return [], None
+    return meta["chunks"], np.load(VECTORS_FILE)
+
+
+def _save(model, chunks, matrix):
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = VECTORS_FILE.with_suffix(".tmp.npy")
+    np.save(tmp, matrix)
+    os.replace(tmp, VECTORS_FILE)
+    with open(META_FILE, "w", encoding="utf-8") as f:
+        json.dump({"model": model, "chunks": chunks}, f)
+
+
+def update_index(files, embed_fn, model: str):
+    """Brings the index up to date with `files`; returns (chunks, matrix, embedded count).
+
+    Vectors are reused by chunk hash, so only new or edited functions are
+    embedded again. Rows are L2-normalised so cosine similarity is a dot product.
+    Changing the embedding `model` rebuilds the whole index.
+    """
+    if np is None:
+        raise RuntimeError("semantic search needs numpy (pip install numpy)")
+
+    old_chunks, old_matrix = _load(model)
+    cached = {c["hash"]: old_matrix[i] for i, c in enumerate(old_chunks)}
+
+    chunks = []
+    for path in files:
+        try:
+            text = path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            continue
+        chunks.extend(chunk_file(Path(os.path.relpath(path)), text))
+
+    missing = [c for c in chunks if c["hash"] not in cached]
+    for i in range(0, len(missing), EMBED_BATCH):
+        batch = missing[i:i + EMBED_BATCH]
+        vectors = np.asarray(embed_fn([c["text"] for c in batch]), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        for c, vec in zip(batch, vectors):
+            cached[c["hash"]] = vec
+
+    matrix = np.stack([cached[c["hash"]] for c in chunks]) if chunks else np.zeros((0, 0), dtype=np.float32)
+    for c in chunks:
+        del c["text"]
+    if chunks != old_chunks:
+        _save(model, chunks, matrix)
+    return chunks, matrix, len(missing)
+
+
+def top_k(chunks, matrix, query_vec, k: int):
+    """The `k` best chunks by cosine similarity as (score, chunk), best first."""
+    if not chunks:
+        return []
+    q = np.asarray(query_vec, dtype=np.float32)
+    scores = matrix @ (q / max(float(np.linalg.norm(q)), 1e-12))
+    k = min(k, len(chunks))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(float(scores[i]), chunks[i]) for i in best]
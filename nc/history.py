@@ -0,0 +1,129 @@
+import json
+import zlib
+import difflib
+import hashlib
+from datetime import datetime, UTC
+from pathlib import Path
+
+OBJECTS_DIR, HISTORY_DIR = Path(".nc/objects"), Path(".nc/history")
+
+
+def _object_path(key: str) -> Path:
+    return OBJECTS_DIR / key[:2] / key[2:]
+
+
+def put_object(data: bytes) -> str:
+    """Stores a zlib-compressed blob keyed by its sha256 and returns the key."""
+    key = hashlib.sha256(data).hexdigest()
+    obj = _object_path(key)
+    if not obj.exists():
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        tmp = obj.with_suffix(".tmp")
+        tmp.write_bytes(zlib.compress(data, 6))
+        tmp.replace(obj)
+    return key
+
+
+def get_object(key: str) -> bytes:
+    obj = _object_path(key)
+    if not obj.exists():
+        raise FileNotFoundError(f"object {key[:12]} missing from store")
+    return zlib.decompress(obj.read_bytes())
+
+
+def _reverse_delta(before: bytes, after: bytes):
+    """Encodes the line edits that turn `after` back into `before`."""
+    a, b = after.splitlines(keepends=True), before.splitlines(keepends=True)
+    ops, added, removed = [], 0, 0
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        # latin-1 round-trips arbitrary bytes, so the delta stays encoding-agnostic
+        ops.append([i1, i2, [l.decode("latin-1") for l in b[j1:j2]]])
+        added += i2 - i1
+        removed += j2 - j1
+    return json.dumps(ops, separators=(",", ":")).encode(), added, removed
+
+
+def _apply_delta(after: bytes, delta: bytes) -> bytes:
+    lines = after.splitlines(keepends=True)
+    for i1, i2, repl in reversed(json.loads(delta)):
+        lines[i1:i2] = [l.encode("latin-1") for l in repl]
+    return b"".join(lines)
+
+
+def _log_path(path: Path) -> Path:
+    key = hashlib.sha256(str(path.resolve()).encode()).hexdigest()[:16]
+    return HISTORY_DIR / f"{key}.json"
+
+
+def _load_log(path: Path):
+    log = _log_path(path)
+    if not log.exists():
+        return {"path": str(path.resolve()), "revisions": []}
+    with open(log, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_log(path: Path, data):
+    HISTORY_DIR.mkdir(parents=True, exist_ok=True)
+    # A log cut short by a crash would lose the file's whole history
+    log = _log_path(path)
+    tmp = log.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    tmp.replace(log)
+
+
+def list_revisions(path: Path):
+    return _load_log(path)["revisions"]
+
+
+def record_revision(path: Path, before: bytes, message: str = ""):
+    """Appends a revision for `path`, storing only the reverse diff to `before`."""
+    after = path.read_bytes()
+    delta, added, removed = _reverse_delta(before, after)
+    entry = {
+        "timestamp": datetime.now(UTC).isoformat(),
+        "message": message,
+        "before": hashlib.sha256(before).hexdigest(),
+        "after": hashlib.sha256(after).hexdigest(),
+        "delta": put_object(delta),
+        "added": added,
+        "removed": removed,
+    }
+    data = _load_log(path)
+    data["revisions"].append(entry)
+    _write_log(path, data)
+    return entry
+
+
+def revert_revisions(path: Path, steps: int = 1):
+    """Undoes the last `steps` revisions of `path` and returns the dropped entries."""
+    data = _load_log(path)
+    revisions = data["revisions"]
+    if steps < 1:
+        raise ValueError("revert count must be at least 1")
+    if steps > len(revisions):
+        raise ValueError(f"only {len(revisions)} revision(s) recorded for {path.name}")
+
+    content = original = path.read_bytes()
+    if hashlib.sha256(content).hexdigest() != revisions[-1]["after"]:
+        raise ValueError("file changed since the last recorded apply; refusing to revert.")
+
+    for entry in reversed(revisions[-steps:]):
+        content = _apply_delta(content, get_object(entry["delta"]))
+        if hashlib.sha256(content).hexdigest() != entry["before"]:
+            raise ValueError(f"revision from {entry['timestamp']} is corrupt (hash mismatch).")
+
+    path.write_bytes(content)
+    dropped = revisions[-steps:]
+    data["revisions"] = revisions[:-steps]
+    try:
+        _write_log(path, data)
+    except Exception:
+        # The log still ends at the reverted revisions, so the file must too
+        path.write_bytes(original)
+        raise
+    return dropped
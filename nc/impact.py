@@ -0,0 +1,181 @@
+import os
+import ast
+import sys
+import json
+import time
+import hashlib
+import subprocess
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .audit import collect_files
+from .config import TEST_GLOBS, TEST_TIMEOUT, TEST_WORKERS
+
+GRAPH_FILE = Path(".nc/testgraph.json")
+
+# Lines of a failed run's output shown to the user
+OUTPUT_TAIL = 30
+
+
+def available() -> bool:
+    return importlib.util.find_spec("pytest") is not None
+
+
+def module_name(path: Path) -> str:
+    """Dotted module name of a workspace file ("src/" layouts drop the prefix)."""
+    parts = list(Path(os.path.relpath(path)).with_suffix("").parts)
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    if parts and parts[0] == "src":
+        parts.pop(0)
+    return ".".join(parts)
+
+
+def _refs(node):
+    """Every name a piece of code calls or reads, attribute names included."""
+    names = set()
+    for sub in ast.walk(node):
+        if isinstance(sub, ast.Name):
+            names.add(sub.id)
+        elif isinstance(sub, ast.Attribute):
+            names.add(sub.attr)
+    return names
+
+
+def _scan(path: Path, text: str):
+    """Imports and test functions of one test file, each test with the names it reaches.
+
+    A test also reaches whatever the module-level helpers and its class's
+    non-test methods (setUp, fixtures) reach, so calls through a local helper
+    still count.
+    """
+    tree = ast.parse(text)
+    package = module_name(path).rsplit(".", 1)[0] if "." in module_name(path) else ""
+
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                anchor = package.split(".")[:len(package.split(".")) - node.level + 1] if package else []
+                base = ".".join(anchor + ([base] if base else []))
+            imports.add(base)
+            # `from pkg import mod` may import a submodule
+            imports.update(f"{base}.{a.name}" if base else a.name for a in node.names)
+
+    helpers = {
+        n.name: _refs(n) for n in tree.body
+        if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and not n.name.startswith("test")
+    }
+
+    def reach(names):
+        seen, todo = set(names), list(names)
+        while todo:
+            for ref in helpers.get(todo.pop(), ()):
+                if ref not in seen:
+                    seen.add(ref)
+                    todo.append(ref)
+        return seen
+
+    tests = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            tests.append({"id": node.name, "refs": sorted(reach(_refs(node)))})
+        elif isinstance(node, ast.ClassDef) and (node.name.startswith("Test") or node.name.endswith("Test")):
+            methods = [m for m in node.body if isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            shared = set().union(*[_refs(m) for m in methods if not m.name.startswith("test")])
+            for m in methods:
+                if m.name.startswith("test"):
+                    tests.append({"id": f"{node.name}::{m.name}", "refs": sorted(reach(_refs(m) | shared))})
+    return {"imports": sorted(imports), "tests": tests}
+
+
+def load_graph():
+    """The per-test-file import/reference graph, rescanning only files that changed."""
+    cached = {}
+    if GRAPH_FILE.exists():
+        with open(GRAPH_FILE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+
+    files = sorted({p for pattern in TEST_GLOBS for p in collect_files(pattern)})
+    graph = {}
+    for path in files:
+        rel = Path(os.path.relpath(path)).as_posix()
+        try:
+            raw = path.read_bytes()
+        except OSError:
+            continue
+        digest = hashlib.sha256(raw).hexdigest()
+        if rel in cached and cached[rel]["hash"] == digest:
+            graph[rel] = cached[rel]
+            continue
+        try:
+            entry = _scan(path, raw.decode("utf-8"))
+        except (SyntaxError, UnicodeDecodeError, ValueError):
+            entry = {"imports": [], "tests": []}
+        graph[rel] = {"hash": digest, **entry}
+
+    if graph != cached:
+        GRAPH_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(GRAPH_FILE, "w", encoding="utf-8") as f:
+            json.dump(graph, f)
+    return graph
+
+
+def impacted_tests(path: Path, changed):
+    """Pytest node ids, grouped by test file, that exercise the `changed` units of `path`.
+
+    A test is impacted when its file imports `path`'s module and it reaches
+    one of the changed functions by name. A change to module-level code
+    impacts every test in the importing files. Edits to a test file select
+    the edited tests themselves.
+    """
+    graph = load_graph()
+    rel = Path(os.path.relpath(path)).as_posix()
+    short = {n.rsplit(".", 1)[-1] for n in changed if n != "<module>"}
+
+    if rel in graph:
+        edited = {n.replace(".", "::") for n in changed}
+        ids = [t["id"] for t in graph[rel]["tests"]] if "<module>" in changed else \
+            [t["id"] for t in graph[rel]["tests"] if t["id"] in edited]
+        return {rel: ids} if ids else {}
+
+    module = module_name(path)
+    selected = {}
+    for test_file, entry in graph.items():
+        if module not in entry["imports"]:
+            continue
+        ids = [t["id"] for t in entry["tests"] if "<module>" in changed or short & set(t["refs"])]
+        if ids:
+            selected[test_file] = ids
+    return selected
+
+
+def _run_file(test_file, ids):
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"] + [f"{test_file}::{i}" for i in ids]
+    started = time.time()
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=TEST_TIMEOUT)
+    except subprocess.TimeoutExpired as e:
+        out = e.stdout.decode(errors="replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+        return {"file": test_file, "tests": len(ids), "status": "timeout", "output": out,
+                "duration": time.time() - started}
+    # 5: nothing collected, e.g. every selected test is skipped or deselected
+    status = "passed" if proc.returncode in (0, 5) else "failed"
+    return {"file": test_file, "tests": len(ids), "status": status, "output": proc.stdout + proc.stderr,
+            "duration": time.time() - started}
+
+
+def run_tests(selected):
+    """Runs each test file's selected tests in its own pytest process, TEST_WORKERS at a time."""
+    if not selected:
+        return []
+    with ThreadPoolExecutor(max_workers=min(TEST_WORKERS, len(selected))) as pool:
+        return list(pool.map(lambda item: _run_file(*item), sorted(selected.items())))
+
+
+def tail(output: str) -> str:
+    return "\n".join(output.rstrip().splitlines()[-OUTPUT_TAIL:])
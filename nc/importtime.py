@@ -0,0 +1,46 @@
+"""Checks `import nc` against the startup budget using `python -X importtime`.
+
+    python -m nc.importtime [--budget MS] [--runs N]
+"""
+import sys
+import argparse
+import subprocess
+
+from .config import IMPORT_BUDGET_MS
+
+
+def measure(module="nc", runs=5):
+    """Best-of-`runs` import profile: (total_us, [(self_us, name), ...])."""
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, check=True,
+        )
+        rows = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+            rows.append((int(self_us), int(cumulative_us), name))
+        total = next(cum for _, cum, name in rows if name == module)
+        if best is None or total < best[0]:
+            best = (total, sorted(((s, n) for s, _, n in rows), reverse=True))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m nc.importtime")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_MS, help="milliseconds")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    total, rows = measure(runs=args.runs)
+    print(f"import nc: {total / 1000:.1f} ms (budget {args.budget:.0f} ms)")
+    for self_us, name in rows[:10]:
+        print(f"  {self_us / 1000:6.1f} ms  {name}")
+    sys.exit(0 if total / 1000 <= args.budget else 1)
+
+
+if __name__ == "__main__":
+    main()
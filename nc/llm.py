@@ -1,8 +1,10 @@
+import re
 import subprocess
 import time
 import json
 import urllib.request
 import socket
+from contextlib import closing
 from pathlib import Path
 
 from .config import (
@@ -13,13 +15,25 @@ from .config import (
     SEED,
     MAX_TOKENS,
     CONTEXT_SIZE,
+    SERVER_SLOTS,
+    REQUEST_TIMEOUT,
 )
+from . import recorder
+from .utils import ResponseParser
+from .profile import load_profile, profile_args, BENCH_SOURCE, BENCH_MAX_TOKENS
 from .prompts import (
     ASK_SYSTEM_PROMPT, EDIT_SYSTEM_PROMPT, VERIFY_SYSTEM_PROMPT,
     CHAT_SYSTEM_PROMPT, SEARCH_SYSTEM_PROMPT, PLAN_SYSTEM_PROMPT, FIX_SYSTEM_PROMPT
 )
 
 
+# ChatML turn delimiters; generation never needs to run past them
+STOP = ["<|im_start|>", "<|im_end|>"]
+FIX_SENTINEL = "No errors detected"
+# Whitespace and markup a model may put in front of the sentinel
+_SENTINEL_LEAD = " \t\r\n*_`>#"
+
+
 def _free_port():
     s = socket.socket()
     s.bind(("127.0.0.1", 0))
@@ -28,7 +42,48 @@ def _free_port():
     return port
 
 
-def start_server():
+def server_alive(port):
+    if recorder.replaying():
+        return True
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/v1/models", timeout=0.3):
+            return True
+    except Exception:
+        return False
+
+
+def server_metrics(port):
+    """llama-server's Prometheus /metrics text, or None if it isn't exposed."""
+    if recorder.replaying():
+        return None
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as resp:
+            return resp.read().decode("utf-8")
+    except Exception:
+        return None
+
+
+def server_busy(port):
+    """True while the server is decoding a request (needs --metrics)."""
+    text = server_metrics(port) or ""
+    m = re.search(r"^llamacpp:requests_processing(?:\{[^}]*\})?\s+([0-9.]+)", text, re.MULTILINE)
+    return bool(m and float(m.group(1)) > 0)
+
+
+def start_server(profile=None, model_path=None, ctx_size=None, embedding=False, parallel=None):
+    """Launches llama-server, using the tuned host profile unless one is given.
+
+    `embedding` starts a dedicated embedding model (only /embedding is served).
+    `parallel` slots each get `ctx_size` tokens of context.
+    """
+    if model_path is None: model_path = MODEL_PATH
+    if ctx_size is None: ctx_size = CONTEXT_SIZE
+    if profile is None:
+        profile = load_profile(model_path)
+    if parallel is None:
+        parallel = max(SERVER_SLOTS, (profile or {}).get("slots", 1))
+    if not Path(model_path).exists():
+        raise FileNotFoundError(f"model not found at: {model_path}")
     if not Path(LLAMA_SERVER_BIN).exists():
         raise FileNotFoundError(f"llama-server binary not found at: {LLAMA_SERVER_BIN}")
 
@@ -37,14 +92,18 @@ def start_server():
     process = subprocess.Popen(
         [
             LLAMA_SERVER_BIN,
-            "--model", MODEL_PATH,
+            "--model", str(model_path),
             "--host", "127.0.0.1",
             "--port", str(port),
-            "--ctx-size", str(CONTEXT_SIZE),
+            "--ctx-size", str(ctx_size * parallel),
+            "--parallel", str(parallel),
             "--cache-ram", "0",
             "--temp", str(TEMPERATURE),
             "--top-p", str(TOP_P),
             "--seed", str(SEED),
+            *profile_args(profile),
+            "--metrics",
+            *(["--embeddings"] if embedding else []),
         ],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
@@ -62,27 +121,235 @@ def start_server():
     raise RuntimeError("llama-server failed to start")
 
 
-def _chat(port, system_content, user_content, history=None, max_tokens=None):
-    if max_tokens is None: max_tokens = MAX_TOKENS
-    url = f"http://127.0.0.1:{port}/v1/completions"
-    
-    # ChatML format construction
-    full_prompt = f"<|im_start|>system\n{system_content.strip()}<|im_end|>\n"
-    
+def _prompt_prefix(system_content, history=None):
+    """ChatML up to the start of the user message; shared by _chat and prefill."""
+    prefix = f"<|im_start|>system\n{system_content.strip()}<|im_end|>\n"
     if history:
         for msg in history:
             role = msg["role"]
             content = msg["content"]
-            full_prompt += f"<|im_start|>{role}\n{content}<|im_end|>\n"
-    
-    full_prompt += f"<|im_start|>user\n{user_content}<|im_end|>\n<|im_start|>assistant\n"
+            prefix += f"<|im_start|>{role}\n{content}<|im_end|>\n"
+    return prefix + "<|im_start|>user\n"
+
+
+def prefill(port, system_content, user_prefix):
+    """Processes a prompt prefix without generating so the slot's KV cache holds it."""
+    if recorder.replaying():
+        return
+    payload = {
+        "prompt": _prompt_prefix(system_content) + user_prefix,
+        "n_predict": 0,
+        "cache_prompt": True,
+    }
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{port}/completion", data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+        resp.read()
+
+
+def count_tokens(port, text):
+    """Prompt size of `text` for the model behind `port` (llama-server /tokenize)."""
+    payload = {"content": text}
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{port}/tokenize", data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+
+    def send():
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    return len(recorder.call("/tokenize", payload, send)["tokens"])
+
+
+def embed(port, texts):
+    """One vector per text from llama-server's /embedding endpoint."""
+    payload = {"content": list(texts)}
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{port}/embedding", data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+
+    def send():
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    data = recorder.call("/embedding", payload, send)
+    if isinstance(data, dict):
+        data = [data]
+
+    vectors = [None] * len(payload["content"])
+    for item in data:
+        vec = item["embedding"]
+        if vec and isinstance(vec[0], list):
+            # --pooling none returns one vector per token: mean-pool them
+            vec = [sum(col) / len(vec) for col in zip(*vec)]
+        vectors[item.get("index", 0)] = vec
+    return vectors
+
+
+def prefill_file(ports, file_text, ask_text=None):
+    """Warms the `FILE:` prefix used by ask/explain and edit. `ports` maps task -> port.
+
+    `ask_text` is the (possibly minified) text ask/explain will send.
+    """
+    prefill(ports["ask"], ASK_SYSTEM_PROMPT, f"FILE:\n{ask_text if ask_text is not None else file_text}\n\n")
+    prefill(ports["edit"], EDIT_SYSTEM_PROMPT, f"FILE:\n{file_text}\n\n")
+
 
+def stop_after_json():
+    """Stream stop condition: the first top-level JSON object has closed."""
+    depth, in_string, escaped = 0, False, False
+
+    def on_text(chunk):
+        nonlocal depth, in_string, escaped
+        for ch in chunk:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"' and depth:
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}" and depth:
+                depth -= 1
+                if not depth:
+                    return True
+        return False
+
+    return on_text
+
+
+def stop_on_phrase(phrase):
+    """Stream stop condition: the response opens with `phrase` (case-insensitive).
+
+    The phrase quoted later, say inside a finding, doesn't stop anything.
+    """
+    needle, head = phrase.lower(), ""
+
+    def on_text(chunk):
+        nonlocal head
+        if head is None:
+            return False
+        head = (head + chunk.lower()).lstrip(_SENTINEL_LEAD)
+        if head.startswith(needle):
+            return True
+        if not needle.startswith(head):
+            # The response opens with something else; stop looking
+            head = None
+        return False
+
+    return on_text
+
+
+def fix_is_clean(content):
+    """True when a fix response is the "no errors" sentinel, not a finding that mentions it."""
+    return content.lstrip(_SENTINEL_LEAD).lower().startswith(FIX_SENTINEL.lower())
+
+
+def _server_seconds(response):
+    """Prompt plus decode time as timed by llama-server; the rest of a request's wall
+    time was spent waiting for a slot (or on the wire). None if the server didn't say."""
+    timings = response.get("timings")
+    if not timings:
+        return None
+    return (timings.get("prompt_ms", 0) + timings.get("predicted_ms", 0)) / 1000
+
+
+def _stream(port, prompt, max_tokens, temperature, seed, on_text):
+    """Streams from llama-server's native /completion endpoint.
+
+    `on_text(chunk)` sees each piece as it arrives; returning True closes the
+    connection, which makes the server stop decoding for this slot.
+    """
+    payload = {
+        "prompt": prompt,
+        "temperature": temperature,
+        "top_p": TOP_P,
+        "seed": seed,
+        "n_predict": max_tokens,
+        "stop": STOP,
+        "stream": True,
+        "cache_prompt": True,
+        # Every event then carries the prompt size, which an early stop still needs
+        "timings_per_token": True,
+    }
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{port}/completion", data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+
+
+    def events():
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+            for raw in resp:
+                line = raw.decode("utf-8").strip()
+                if line.startswith("data: "):
+                    yield json.loads(line[6:])
+
+    start_time = time.time()
+    parts, final, timings = [], {}, {}
+    try:
+        # Closing the generator closes the connection, which stops decoding
+        with closing(recorder.stream("/completion", payload, events)) as stream:
+            for data in stream:
+                timings = data.get("timings") or timings
+                chunk = data.get("content", "")
+                if chunk:
+                    parts.append(chunk)
+                    if on_text(chunk):
+                        break
+                if data.get("stop"):
+                    final = data
+                    break
+    except Exception as e:
+        raise RuntimeError(f"LLM request failed: {str(e)}") from e
+
+    duration = time.time() - start_time
+    # Token counts only arrive with the final event. After an early stop each
+    # streamed piece is one token, and the prompt size comes from the last
+    # event's timings (cached plus newly evaluated tokens); None if the server
+    # sent none.
+    completion_tokens = final.get("tokens_predicted", len(parts))
+    if final:
+        prompt_tokens = final.get("tokens_evaluated", 0)
+    elif timings:
+        prompt_tokens = timings.get("prompt_n", 0) + timings.get("cache_n", 0)
+    else:
+        prompt_tokens = None
+    metrics = {
+        "duration": duration,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_per_sec": completion_tokens / duration if duration > 0 else 0,
+        "stopped_early": not final,
+        "server_seconds": _server_seconds(final or {"timings": timings}),
+    }
+    return "".join(parts).strip(), metrics
+
+
+def _chat(port, system_content, user_content, history=None, max_tokens=None, temperature=None, seed=None, on_text=None):
+    if max_tokens is None: max_tokens = MAX_TOKENS
+    if temperature is None: temperature = TEMPERATURE
+    if seed is None: seed = SEED
+    full_prompt = _prompt_prefix(system_content, history) + f"{user_content}<|im_end|>\n<|im_start|>assistant\n"
+    if on_text is not None:
+        return _stream(port, full_prompt, max_tokens, temperature, seed, on_text)
+
+    url = f"http://127.0.0.1:{port}/v1/completions"
     payload = {
         "prompt": full_prompt,
-        "temperature": TEMPERATURE,
+        "temperature": temperature,
         "top_p": TOP_P,
+        "seed": seed,
         "max_tokens": max_tokens,
-        "stop": ["<|im_start|>", "<|im_end|>"],
+        "stop": STOP,
     }
 
     req = urllib.request.Request(
@@ -90,31 +357,48 @@ def _chat(port, system_content, user_content, history=None, max_tokens=None):
         headers={"Content-Type": "application/json"}, method="POST",
     )
 
+    def send():
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+            return json.loads(resp.read().decode())
+
     start_time = time.time()
     try:
-        with urllib.request.urlopen(req, timeout=300) as resp:
-            out = json.loads(resp.read().decode())
-            duration = time.time() - start_time
-            content = out["choices"][0]["text"].strip()
-            usage = out.get("usage", {})
-            metrics = {
-                "duration": duration,
-                "prompt_tokens": usage.get("prompt_tokens", 0),
-                "completion_tokens": usage.get("completion_tokens", 0),
-                "tokens_per_sec": usage.get("completion_tokens", 0) / duration if duration > 0 else 0
-            }
-            return content, metrics
+        out = recorder.call("/v1/completions", payload, send)
+        duration = time.time() - start_time
+        content = out["choices"][0]["text"].strip()
+        usage = out.get("usage", {})
+        metrics = {
+            "duration": duration,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "tokens_per_sec": usage.get("completion_tokens", 0) / duration if duration > 0 else 0,
+            "server_seconds": _server_seconds(out),
+        }
+        return content, metrics
     except Exception as e:
         raise RuntimeError(f"LLM request failed: {str(e)}") from e
 
 
-def ask_once(port, prompt):
-    return _chat(port, ASK_SYSTEM_PROMPT, prompt)
+def benchmark_server(port, runs=2):
+    """Times a fixed explain-style request; returns the fastest run's metrics."""
+    source = BENCH_SOURCE.read_text(encoding="utf-8")
+    best = None
+    for i in range(runs):
+        # Vary the head of the prompt so later runs can't reuse the cached prefill
+        prompt = f"RUN {i}\nFILE:\n{source}\n\nQUESTION:\nSummarize this file."
+        _, metrics = _chat(port, ASK_SYSTEM_PROMPT, prompt, max_tokens=BENCH_MAX_TOKENS)
+        if best is None or metrics["duration"] < best["duration"]:
+            best = metrics
+    return best
 
 
-def run_edit_llm(port, file_text, instruction):
+def ask_once(port, prompt, on_text=None):
+    return _chat(port, ASK_SYSTEM_PROMPT, prompt, on_text=on_text)
+
+
+def run_edit_llm(port, file_text, instruction, temperature=None, seed=None, on_text=None):
     user_prompt = f"FILE:\n{file_text}\n\nINSTRUCTION:\n{instruction}"
-    return _chat(port, EDIT_SYSTEM_PROMPT, user_prompt)
+    return _chat(port, EDIT_SYSTEM_PROMPT, user_prompt, temperature=temperature, seed=seed, on_text=on_text)
 
 def run_chat_llm(port, history, message):
     return _chat(port, CHAT_SYSTEM_PROMPT, message, history=history)
@@ -128,7 +412,14 @@ def run_plan_llm(port, goal, context=""):
     return _chat(port, PLAN_SYSTEM_PROMPT, user_prompt)
 
 def run_fix_llm(port, file_text):
-    return _chat(port, FIX_SYSTEM_PROMPT, f"FILE CONTENT:\n{file_text}")
+    # Stop at the "no bugs" sentinel or once the suggested fix diff is closed
+    sentinel, parser = stop_on_phrase(FIX_SENTINEL), ResponseParser()
+
+    def on_text(chunk):
+        hit = sentinel(chunk)
+        return parser.feed(chunk) or hit
+
+    return _chat(port, FIX_SYSTEM_PROMPT, f"FILE CONTENT:\n{file_text}", on_text=on_text)
 
 
 
@@ -139,8 +430,9 @@ def get_confidence_score(port, file_text, instruction, diff):
         f"INSTRUCTION:\n{instruction}\n\n"
         f"GENERATED DIFF:\n{diff}"
     )
+    content = ""
     try:
-        content, _ = _chat(port, VERIFY_SYSTEM_PROMPT, verify_prompt, max_tokens=256)
+        content, _ = _chat(port, VERIFY_SYSTEM_PROMPT, verify_prompt, max_tokens=256, on_text=stop_after_json())
         
         # Robust JSON extraction
         json_content = content
@@ -157,7 +449,6 @@ def get_confidence_score(port, file_text, instruction, diff):
             data = json.loads(json_content)
         except json.JSONDecodeError:
             # Try to see if there's any JSON-like part that works
-            import re
             matches = re.findall(r"\{.*?\}", content, re.DOTALL)
             for m in matches:
                 try:
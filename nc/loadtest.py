@@ -0,0 +1,313 @@
+"""Load test: M concurrent nc sessions replaying a command mix against one llama-server.
+
+    python -m nc.loadtest [--sessions M] [--duration S] [--mix edit=5,chat=3,search=2]
+                          [--slots 1,2,4] [--ctx N] [--file PATH] [--port P | --stub] [--json PATH]
+
+Sessions send the same requests nc does: an edit streams a diff, has it
+verified and retries once if either step fails; chat carries its growing
+history; search sends the file's functions as snippets. By default a
+llama-server is launched for every --slots value with --ctx tokens per slot.
+--port measures a server that is already running; --stub serves canned
+answers with modelled prefill/decode speeds, to check the harness itself.
+
+Per slot count it reports throughput, latency percentiles per command and
+queue wait: wall time minus the prompt and decode time llama-server reports.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from . import llm
+from .config import CONTEXT_SIZE, PARALLEL_SLOTS, CHAT_HISTORY_LIMIT, MODEL_PATH
+from .diff_utils import validate_unified_diff
+from .profile import BENCH_SOURCE
+from .symbols import code_units
+from .utils import ResponseParser
+
+DEFAULT_MIX = "edit=5,chat=3,search=2"
+
+INSTRUCTIONS = (
+    "Add type hints to every function.",
+    "Add a docstring to the first function.",
+    "Rename the first local variable to something more descriptive.",
+    "Handle the case where the input is empty.",
+)
+QUESTIONS = (
+    "What does this file do?",
+    "Which function is the most complex and why?",
+    "Is there any error handling missing?",
+)
+QUERIES = ("where is the input parsed", "error handling", "main entry point")
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("edit", "chat", "search"):
+            raise ValueError(f"unknown command in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Session:
+    """One simulated developer: picks commands from the mix until the deadline."""
+
+    def __init__(self, n, port, text, mix, seed):
+        self.n, self.port, self.text = n, port, text
+        self.rng = random.Random(seed + n)
+        self.kinds, self.weights = list(mix), list(mix.values())
+        self.history = []
+        self.samples = []
+        units = code_units(text) or []
+        lines = text.splitlines()
+        self.snippets = "\n".join(
+            f"--- {u['name']} (line {u['line']}) ---\n" + "\n".join(lines[u["line"] - 1:u["end"]])
+            for u in units if u["name"] != "<module>"
+        ) or text
+
+    def _request(self, kind, fn, metered=True):
+        """Times one request; `fn` returns (result, metrics) unless `metered` is False."""
+        started = time.time()
+        try:
+            result = fn()
+        except Exception as e:
+            self.samples.append({"kind": kind, "ok": False, "error": str(e), "wall": time.time() - started})
+            raise
+        sample = {"kind": kind, "ok": True, "wall": time.time() - started, "wait": None, "tokens": 0}
+        if metered:
+            result, metrics = result
+            server = metrics.get("server_seconds")
+            if server is not None:
+                sample["wait"] = max(0.0, metrics["duration"] - server)
+            sample["tokens"] = (metrics["prompt_tokens"] or 0) + metrics["completion_tokens"]
+        self.samples.append(sample)
+        return result
+
+    def edit(self):
+        instruction = self.rng.choice(INSTRUCTIONS)
+        # Same loop as _generate_edit: up to two generate + verify rounds
+        for _ in range(2):
+            parser = ResponseParser()
+            out = self._request("edit", lambda: llm.run_edit_llm(self.port, self.text, instruction, on_text=parser.feed))
+            try:
+                diff = validate_unified_diff(out)
+            except ValueError:
+                continue
+            score, _ = self._request(
+                "verify", lambda: llm.get_confidence_score(self.port, self.text, instruction, diff), metered=False,
+            )
+            if score > 0:
+                return
+
+    def chat(self):
+        message = f"FILE:\n{self.text}\n\n{self.rng.choice(QUESTIONS)}" if not self.history else self.rng.choice(QUESTIONS)
+        reply = self._request("chat", lambda: llm.run_chat_llm(self.port, self.history[-CHAT_HISTORY_LIMIT:], message))
+        self.history += [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+
+    def search(self):
+        self._request("search", lambda: llm.run_search_llm(self.port, self.rng.choice(QUERIES), self.snippets))
+
+    def run(self, deadline, think):
+        while time.time() < deadline:
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            try:
+                getattr(self, kind)()
+            except Exception:
+                pass
+            if think:
+                time.sleep(self.rng.uniform(0, 2 * think))
+
+
+def run_load(port, text, sessions, duration, mix, think=0.0, seed=0):
+    """Runs `sessions` concurrent sessions for `duration` seconds; returns all samples."""
+    deadline = time.time() + duration
+    workers = [Session(i, port, text, mix, seed) for i in range(sessions)]
+    threads = [threading.Thread(target=w.run, args=(deadline, think), daemon=True) for w in workers]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return [s for w in workers for s in w.samples], time.time() - started
+
+
+def summarize(samples, elapsed):
+    ok = [s for s in samples if s["ok"]]
+    waits = [s["wait"] for s in ok if s["wait"] is not None]
+    report = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "req_per_sec": len(ok) / elapsed if elapsed else 0,
+        "tok_per_sec": sum(s["tokens"] for s in ok) / elapsed if elapsed else 0,
+        "wait_p50": percentile(waits, 50),
+        "wait_p95": percentile(waits, 95),
+        "commands": {},
+    }
+    for kind in sorted({s["kind"] for s in ok}):
+        walls = [s["wall"] for s in ok if s["kind"] == kind]
+        report["commands"][kind] = {
+            "count": len(walls), **{f"p{q}": percentile(walls, q) for q in (50, 95, 99)},
+        }
+    return report
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds:.2f}s"
+
+
+def print_report(slots, report):
+    print(
+        f"slots={slots}: {report['requests']} requests, {report['errors']} errors, "
+        f"{report['req_per_sec']:.2f} req/s, {report['tok_per_sec']:.0f} tok/s, "
+        f"queue wait p50 {_fmt(report['wait_p50'])} p95 {_fmt(report['wait_p95'])}"
+    )
+    for kind, c in report["commands"].items():
+        print(f"  {kind:<7} n={c['count']:<5} p50 {_fmt(c['p50']):>8}  p95 {_fmt(c['p95']):>8}  p99 {_fmt(c['p99']):>8}")
+
+
+class StubServer:
+    """A stand-in llama-server with `slots` slots and fixed prefill/decode speeds.
+
+    Requests beyond the free slots queue, as on the real server. Edits get a
+    one-line diff of the file, verifies a passing score; anything else a
+    fixed-length answer. It models queueing only, not batching slowdowns.
+    """
+
+    def __init__(self, slots, prefill_tps=800.0, decode_tps=40.0, reply_tokens=120):
+        self.slots = threading.Semaphore(slots)
+        self.prefill_tps, self.decode_tps, self.reply_tokens = prefill_tps, decode_tps, reply_tokens
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.send_response(200 if self.path in ("/v1/models", "/health") else 404)
+                self.end_headers()
+                self.wfile.write(b'{"data": []}')
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.slots:
+                    stub._serve(self, payload)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def _answer(self, prompt):
+        if "GENERATED DIFF:" in prompt:
+            return '{"score": 90, "reason": "stub"}'
+        if "INSTRUCTION:" in prompt:
+            first = prompt.split("FILE:\n", 1)[-1].splitlines()[0]
+            return f"```diff\n--- a/FILE\n+++ b/FILE\n@@ -1,1 +1,1 @@\n-{first}\n+{first}  # edited\n```"
+        return " ".join(["token"] * self.reply_tokens)
+
+    def _serve(self, handler, payload):
+        prompt = payload["prompt"]
+        answer = self._answer(prompt)
+        prompt_n, words = len(prompt) // 4, answer.split(" ")
+        prompt_s = prompt_n / self.prefill_tps
+        time.sleep(prompt_s)
+        timings = {
+            "prompt_n": prompt_n, "prompt_ms": prompt_s * 1000, "predicted_ms": len(words) / self.decode_tps * 1000,
+        }
+
+        handler.send_response(200)
+        if not payload.get("stream"):
+            time.sleep(len(words) / self.decode_tps)
+            body = json.dumps({
+                "choices": [{"text": answer}], "timings": timings,
+                "usage": {"prompt_tokens": prompt_n, "completion_tokens": len(words)},
+            }).encode()
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+            return
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.end_headers()
+        try:
+            for i, word in enumerate(words):
+                time.sleep(1 / self.decode_tps)
+                event = {"content": word if i == 0 else " " + word}
+                if payload.get("timings_per_token"):
+                    event["timings"] = {**timings, "predicted_ms": (i + 1) / self.decode_tps * 1000}
+                handler.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            final = {"content": "", "stop": True, "tokens_evaluated": prompt_n,
+                     "tokens_predicted": len(words), "timings": timings}
+            handler.wfile.write(f"data: {json.dumps(final)}\n\n".encode())
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped early, e.g. once the diff block closed
+            pass
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m nc.loadtest")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=60, help="seconds per slot count")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="command weights, e.g. edit=5,chat=3,search=2")
+    parser.add_argument("--slots", default=str(PARALLEL_SLOTS), help="comma-separated --parallel values to compare")
+    parser.add_argument("--ctx", type=int, default=CONTEXT_SIZE, help="context tokens per slot")
+    parser.add_argument("--file", default=str(BENCH_SOURCE), help="source file the sessions work on")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds between a session's commands")
+    parser.add_argument("--seed", type=int, default=0)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--port", type=int, help="measure a running server instead of launching one")
+    target.add_argument("--stub", action="store_true", help="use the built-in stub server")
+    parser.add_argument("--json", help="also write the reports to this file")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+        slot_counts = [int(s) for s in args.slots.split(",")]
+    except ValueError as e:
+        parser.error(str(e))
+    text = Path(args.file).read_text(encoding="utf-8")
+
+    print(f"{args.sessions} sessions, {args.duration:.0f}s per run, mix {args.mix}, {args.ctx} ctx/slot")
+    reports = {}
+    for slots in ([None] if args.port else slot_counts):
+        if args.port:
+            port, stop = args.port, lambda: None
+        elif args.stub:
+            stub = StubServer(slots)
+            port, stop = stub.port, stub.close
+        else:
+            process, port = llm.start_server(model_path=args.model, ctx_size=args.ctx, parallel=slots)
+            stop = lambda: (process.terminate(), process.wait())
+        try:
+            samples, elapsed = run_load(port, text, args.sessions, args.duration, mix, args.think, args.seed)
+        finally:
+            stop()
+        report = summarize(samples, elapsed)
+        label = slots or f"port {args.port}"
+        print_report(label, report)
+        reports[str(label)] = report
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"sessions": args.sessions, "mix": mix, "ctx": args.ctx, "runs": reports}, f, indent=2)
+    failed = all(r["requests"] == r["errors"] for r in reports.values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime, UTC
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to O_EXCL files plus PID liveness checks
+    fcntl = None
+
+# Held by the interactive shell: one session per workspace
+SESSION_LOCK = Path(".nc/lock")
+# Reader/writer lock around state.json and file writes; any number of readers
+DATA_LOCK = Path(".nc/data.lock")
+
+
+class LockBusy(Exception):
+    def __init__(self, holder):
+        self.holder = holder or {}
+        pid = self.holder.get("pid")
+        super().__init__(f"workspace is locked by pid {pid}" if pid else "workspace is locked")
+
+
+def pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def lock_holder(path=SESSION_LOCK):
+    """The {"pid", "since"} record written by the lock's owner, if any.
+
+    Lock files from older versions hold a bare PID.
+    """
+    try:
+        raw = path.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    if not raw:
+        return None
+    try:
+        return json.loads(raw) if raw.startswith("{") else {"pid": int(raw)}
+    except ValueError:
+        return None
+
+
+_session = None
+
+
+def acquire_session():
+    """Takes the session lock for this process; idempotent.
+
+    The kernel drops an fcntl lock when its owner dies, so a lock file left
+    behind by a crashed session is simply taken over. Without fcntl the
+    recorded PID decides whether the file is stale.
+    """
+    global _session
+    if _session is not None:
+        return
+    SESSION_LOCK.parent.mkdir(parents=True, exist_ok=True)
+    record = json.dumps({"pid": os.getpid(), "since": datetime.now(UTC).isoformat()})
+
+    if fcntl is None:
+        for _ in range(2):
+            try:
+                fd = os.open(SESSION_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                holder = lock_holder()
+                if holder and pid_alive(holder.get("pid")):
+                    raise LockBusy(holder)
+                SESSION_LOCK.unlink(missing_ok=True)
+                continue
+            os.write(fd, record.encode())
+            os.close(fd)
+            _session = True
+            return
+        raise LockBusy(lock_holder())
+
+    fd = os.open(SESSION_LOCK, os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        raise LockBusy(lock_holder())
+    os.ftruncate(fd, 0)
+    os.write(fd, record.encode())
+    _session = fd
+
+
+def release_session():
+    global _session
+    if _session is None:
+        return
+    if fcntl is None:
+        SESSION_LOCK.unlink(missing_ok=True)
+    else:
+        # Never unlink a flock'd file: a waiter could lock the orphaned inode
+        os.ftruncate(_session, 0)
+        os.close(_session)
+    _session = None
+
+
+_held = threading.local()
+
+
+@contextmanager
+def data_lock(shared=False):
+    """Shared (read) or exclusive (write) access to workspace data across processes.
+
+    Re-entrant within a thread; an exclusive request inside a shared one is
+    a programming error. A no-op where fcntl is unavailable.
+    """
+    depth = getattr(_held, "depth", 0)
+    if depth:
+        if not shared and _held.shared:
+            raise RuntimeError("cannot upgrade a shared workspace lock")
+        _held.depth += 1
+        try:
+            yield
+        finally:
+            _held.depth -= 1
+        return
+
+    if fcntl is None or not DATA_LOCK.parent.exists():
+        yield
+        return
+
+    fd = os.open(DATA_LOCK, os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        _held.depth, _held.shared = 1, shared
+        try:
+            yield
+        finally:
+            _held.depth = 0
+    finally:
+        os.close(fd)
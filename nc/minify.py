@@ -0,0 +1,81 @@
+import io
+import re
+import ast
+import tokenize
+
+# Longer string literals are cut to this many characters of their first line
+LITERAL_MAX = 60
+
+_STRING_HEAD = re.compile(r"^([A-Za-z]*)('''|\"\"\"|'|\")")
+_LINE_REF = re.compile(r"\b(lines?|L)(\s*)(\d+)(?:(\s*(?:-|–|to)\s*)(\d+))?", re.IGNORECASE)
+
+
+def _docstring_spans(tree):
+    spans = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                spans.add((body[0].lineno, body[0].col_offset))
+    return spans
+
+
+def _shorten(token: str, summary_only: bool) -> str:
+    m = _STRING_HEAD.match(token)
+    if not m:
+        return token
+    prefix, quote = m.groups()
+    body = token[len(prefix) + len(quote):-len(quote)]
+    first = next((l.strip() for l in body.splitlines() if l.strip()), "")
+    if summary_only:
+        # Docstrings keep their summary line only
+        return f'{prefix}"""{first}"""'
+    return f"{prefix}{quote}{first[:LITERAL_MAX]}...{quote}"
+
+
+def minify(text: str):
+    """Drops comments, blank lines and docstring bodies and cuts long literals.
+
+    Returns (text, line_map) where line_map[i] is the original line number of
+    output line i + 1. Sources that don't tokenize only lose blank lines.
+    """
+    lines = [[n, l] for n, l in enumerate(text.splitlines(), start=1)]
+    edits = []
+    try:
+        docstrings = _docstring_spans(ast.parse(text))
+        for tok in tokenize.generate_tokens(io.StringIO(text).readline):
+            if tok.type == tokenize.COMMENT:
+                edits.append((tok.start, tok.end, ""))
+            elif tok.type == tokenize.STRING:
+                if tok.start in docstrings:
+                    edits.append((tok.start, tok.end, _shorten(tok.string, True)))
+                elif len(tok.string) > LITERAL_MAX + 8:
+                    edits.append((tok.start, tok.end, _shorten(tok.string, False)))
+    except (SyntaxError, tokenize.TokenError, IndentationError):
+        edits = []
+
+    # Back to front so earlier positions stay valid; a multi-line token
+    # collapses onto the line it starts on.
+    for (r1, c1), (r2, c2), repl in reversed(edits):
+        lines[r1 - 1][1] = lines[r1 - 1][1][:c1] + repl + lines[r2 - 1][1][c2:]
+        del lines[r1:r2]
+
+    kept = [(n, l.rstrip()) for n, l in lines if l.strip()]
+    return "\n".join(l for _, l in kept), [n for n, _ in kept]
+
+
+def restore_lines(answer: str, line_map) -> str:
+    """Rewrites "line 12" / "lines 3-5" / "L7" in a model answer to original line numbers."""
+    def orig(num):
+        n = int(num)
+        return str(line_map[n - 1]) if 1 <= n <= len(line_map) else num
+
+    def sub(m):
+        word, space, start, sep, end = m.groups()
+        out = f"{word}{space}{orig(start)}"
+        if end:
+            out += f"{sep}{orig(end)}"
+        return out
+
+    return _LINE_REF.sub(sub, answer)
@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+
+from .config import MODEL_PATH, CONTEXT_SIZE
+
+MODELS_FILE = Path(".nc/models.json")
+DEFAULT_MODEL = "default"
+
+# One entry per llm.py entry point that can be routed independently
+TASKS = ("ask", "edit", "verify", "chat", "search", "plan", "fix", "embed")
+
+
+def load_registry():
+    """Reads .nc/models.json on top of the built-in single-model setup.
+
+    Example:
+        {
+          "models": {"small": {"path": "models/qwen2.5-coder-0.5b.gguf", "ctx_size": 4096}},
+          "routes": {"verify": "small", "search": "small"}
+        }
+
+    A model with a "port" instead of a "path" points at an already running server.
+    Models with "embedding": true are started with --embeddings; route "embed" to one.
+    """
+    registry = {
+        "models": {DEFAULT_MODEL: {"path": MODEL_PATH, "ctx_size": CONTEXT_SIZE}},
+        "routes": {},
+    }
+    if MODELS_FILE.exists():
+        with open(MODELS_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        registry["models"].update(data.get("models", {}))
+        registry["routes"].update(data.get("routes", {}))
+
+    for task, name in registry["routes"].items():
+        if task not in TASKS:
+            raise ValueError(f"models.json routes unknown task '{task}' (expected one of {', '.join(TASKS)})")
+        if name not in registry["models"]:
+            raise ValueError(f"models.json routes '{task}' to undefined model '{name}'")
+    for name, spec in registry["models"].items():
+        if "path" not in spec and "port" not in spec:
+            raise ValueError(f"model '{name}' needs either a 'path' or a 'port'")
+    return registry
+
+
+def model_for(task: str):
+    """Returns (name, spec) of the model that serves `task`."""
+    registry = load_registry()
+    name = registry["routes"].get(task, DEFAULT_MODEL)
+    return name, registry["models"][name]
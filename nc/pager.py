@@ -0,0 +1,66 @@
+import bisect
+
+from .utils import console
+
+# Lines of the panel, prompt and shell prompt around a page of diff
+CHROME_LINES = 6
+
+KEYS = "Enter next, b back, n/p next/prev hunk, N hunk N, q quit"
+
+
+def hunk_starts(lines):
+    return [i for i, line in enumerate(lines) if line.startswith("@@")]
+
+
+def _render(lines, top, height, title, border_style, hunks):
+    from rich.panel import Panel
+    from rich.syntax import Syntax
+
+    end = min(top + height, len(lines))
+    # Diff highlighting is per line, so lexing just the window is exact
+    syntax = Syntax("\n".join(lines[top:end]), "diff", theme="monokai", line_numbers=True, start_line=top + 1)
+    if height < len(lines):
+        title += f" (lines {top + 1}-{end} of {len(lines)}"
+        title += f", hunk {bisect.bisect_right(hunks, top) or 1}/{len(hunks)})" if hunks else ")"
+    console.print(Panel(syntax, title=title, border_style=border_style))
+    return end
+
+
+def show_diff(diff: str, title: str, border_style="yellow", hunk=None):
+    """Shows a diff one screen at a time, highlighting only the visible window.
+
+    Diffs that fit on screen, and output that isn't a terminal, are printed
+    in full. `hunk` (1-based) starts the view at that hunk.
+    """
+    lines = diff.splitlines()
+    hunks = hunk_starts(lines)
+    if hunk is not None and not 1 <= hunk <= len(hunks):
+        console.print(f"[yellow]![/yellow] no hunk {hunk}; this diff has {len(hunks)}")
+        return
+
+    height = max(10, console.size.height - CHROME_LINES)
+    if not console.is_terminal or (len(lines) <= height and hunk is None):
+        _render(lines, 0, len(lines) or 1, title, border_style, hunks)
+        return
+
+    top = hunks[hunk - 1] if hunk else 0
+    while True:
+        end = _render(lines, top, height, title, border_style, hunks)
+        try:
+            reply = console.input(f"[dim]-- {KEYS} --[/dim] ").strip().lower()
+        except (EOFError, KeyboardInterrupt):
+            return
+        current = bisect.bisect_right(hunks, top) - 1
+        if reply == "q" or (reply == "" and end >= len(lines)):
+            return
+        if reply == "":
+            top = end
+        elif reply == "b":
+            top = max(0, top - height)
+        elif reply == "n" and current + 1 < len(hunks):
+            top = hunks[current + 1]
+        elif reply == "p" and hunks:
+            # From inside a hunk, "p" goes back to its header first
+            top = hunks[current - 1] if current > 0 and top == hunks[current] else hunks[max(current, 0)]
+        elif reply.isdigit() and 1 <= int(reply) <= len(hunks):
+            top = hunks[int(reply) - 1]
@@ -0,0 +1,77 @@
+import os
+import json
+import platform
+from pathlib import Path
+
+from .config import MODEL_PATH
+
+PROFILE_FILE = Path.home() / ".config" / "nc" / "profiles.json"
+
+# Fixed benchmark input: a frozen copy of real source, so every host and every
+# version of nc is measured against the same prompt. Never edit it: launch
+# profiles measured on different text are not comparable. Kept as data, not a module.
+BENCH_SOURCE = Path(__file__).with_name("bench") / "source.txt"
+BENCH_MAX_TOKENS = 128
+
+
+def profile_key(model_path=MODEL_PATH) -> str:
+    """Profiles are per host and per model file."""
+    return f"{platform.node()}:{Path(model_path).name}"
+
+
+def _load_all():
+    if not PROFILE_FILE.exists():
+        return {}
+    try:
+        with open(PROFILE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def load_profile(model_path=MODEL_PATH):
+    return _load_all().get(profile_key(model_path))
+
+
+def save_profile(profile):
+    profiles = _load_all()
+    profiles[profile_key()] = profile
+    PROFILE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(PROFILE_FILE, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+
+
+def profile_args(profile) -> list:
+    """Translates a stored profile into llama-server launch flags."""
+    if not profile:
+        return []
+    args = [
+        "--threads", str(profile["threads"]),
+        "--batch-size", str(profile["batch_size"]),
+        "--ubatch-size", str(profile["ubatch_size"]),
+    ]
+    if profile.get("flash_attn"):
+        args += ["--flash-attn", "on"]
+    if profile.get("mlock"):
+        args.append("--mlock")
+    if profile.get("cont_batching", True):
+        args.append("--cont-batching")
+    return args
+
+
+def candidate_profiles():
+    """A small grid around the usual sweet spots: physical vs logical cores, batch sizes."""
+    cores = os.cpu_count() or 4
+    threads = sorted({max(1, cores // 2), cores})
+    profiles = []
+    for t in threads:
+        for batch, ubatch in ((512, 512), (2048, 512)):
+            profiles.append({
+                "threads": t, "batch_size": batch, "ubatch_size": ubatch,
+                "flash_attn": False, "mlock": False, "cont_batching": True,
+            })
+    profiles.append({
+        "threads": threads[0], "batch_size": 2048, "ubatch_size": 512,
+        "flash_attn": True, "mlock": False, "cont_batching": True,
+    })
+    return profiles
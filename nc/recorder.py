@@ -0,0 +1,141 @@
+"""Record/replay of model-server traffic.
+
+    NC_RECORD=<name>   append every request and its raw response to .nc/recordings/<name>.jsonl
+    NC_REPLAY=<name>   serve responses from that file instead of llama-server
+    NC_REPLAY_SPEED    replay pacing: 0 (default) as fast as possible, 1 real time, 2 twice as fast
+
+Requests are matched on their exact payload (prompt, sampling settings,
+seed), so a replayed session is deterministic. Repeats of one request are
+served in recorded order.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import closing
+from pathlib import Path
+
+RECORDINGS_DIR = Path(".nc/recordings")
+
+_lock = threading.Lock()
+_replay = None
+
+
+def _name(var):
+    return os.environ.get(var) or None
+
+
+def recording() -> bool:
+    return _name("NC_RECORD") is not None
+
+
+def replaying() -> bool:
+    return _name("NC_REPLAY") is not None
+
+
+def _path(name):
+    return RECORDINGS_DIR / f"{name}.jsonl"
+
+
+def _key(endpoint, payload):
+    raw = json.dumps({"endpoint": endpoint, "payload": payload}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _speed():
+    try:
+        return float(os.environ.get("NC_REPLAY_SPEED", "0"))
+    except ValueError:
+        return 0.0
+
+
+def _sleep(seconds):
+    speed = _speed()
+    if speed > 0 and seconds > 0:
+        time.sleep(seconds / speed)
+
+
+def _append(entry):
+    with _lock:
+        RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_path(_name("NC_RECORD")), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def _next_entry(endpoint, payload):
+    global _replay
+    name = _name("NC_REPLAY")
+    key = _key(endpoint, payload)
+    with _lock:
+        if _replay is None or _replay["name"] != name:
+            entries = {}
+            path = _path(name)
+            if not path.exists():
+                raise RuntimeError(f"no recording at {path}")
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries.setdefault(entry["key"], []).append(entry)
+            _replay = {"name": name, "entries": entries, "served": {}}
+
+        queue = _replay["entries"].get(key)
+        if not queue:
+            raise RuntimeError(f"recording '{name}' has no response for this {endpoint} request")
+        n = _replay["served"].get(key, 0)
+        _replay["served"][key] = n + 1
+        # Past the end, keep serving the last response for this request
+        return queue[min(n, len(queue) - 1)]
+
+
+def call(endpoint, payload, send):
+    """Wraps a plain JSON request; `send()` performs it and returns the decoded body."""
+    if replaying():
+        entry = _next_entry(endpoint, payload)
+        _sleep(entry["duration"])
+        return entry["response"]
+
+    start = time.time()
+    response = send()
+    if recording():
+        _append({
+            "key": _key(endpoint, payload), "endpoint": endpoint, "payload": payload,
+            "response": response, "duration": time.time() - start,
+        })
+    return response
+
+
+def stream(endpoint, payload, events):
+    """Wraps a streamed request; `events()` yields the decoded SSE data objects.
+
+    A consumer that stops early is recorded up to that point, which is all a
+    replay of the same pipeline will ask for.
+    """
+    if replaying():
+        entry = _next_entry(endpoint, payload)
+        last = 0.0
+        for offset, data in entry["events"]:
+            _sleep(offset - last)
+            last = offset
+            yield data
+        return
+
+    if not recording():
+        yield from events()
+        return
+
+    start, seen = time.time(), []
+
+    def save():
+        _append({"key": _key(endpoint, payload), "endpoint": endpoint, "payload": payload, "events": seen})
+
+    try:
+        with closing(events()) as source:
+            for data in source:
+                seen.append((time.time() - start, data))
+                yield data
+    except GeneratorExit:
+        save()
+        raise
+    save()
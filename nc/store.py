@@ -0,0 +1,198 @@
+import os
+import json
+import zlib
+import sqlite3
+from contextlib import closing
+from datetime import datetime, UTC
+from pathlib import Path
+
+from .lock import data_lock
+
+STORE_FILE = Path(".nc/store.db")
+STATE_FILE = Path(".nc/state.json")
+# state.json keys older versions kept chat histories and plans under
+INLINE_KEYS = ("chat_history", "plans", "pending_plan")
+
+# Short messages aren't worth the zlib header
+COMPRESS_MIN = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content BLOB NOT NULL,
+    compressed INTEGER NOT NULL,
+    ts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_file ON messages (file, id);
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    goal TEXT NOT NULL,
+    content BLOB NOT NULL,
+    compressed INTEGER NOT NULL,
+    saved INTEGER NOT NULL,
+    ts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plans_file ON plans (file, saved, id);
+"""
+
+
+_migrated = False
+
+
+def _connect():
+    global _migrated
+    STORE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(STORE_FILE, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    if not _migrated:
+        # Every command that reads history gets here first, shell or not
+        _migrated = True
+        _migrate_state()
+    return conn
+
+
+def _read_state():
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _migrate_state():
+    """Moves chat histories and plans that older versions kept in state.json into the store."""
+    def inline(state):
+        return any(k in f for f in state.get("files", {}).values() for k in INLINE_KEYS)
+
+    if not inline(_read_state()):
+        return
+    with data_lock():
+        # Re-read under the lock: another process may have just migrated
+        state = _read_state()
+        if not inline(state):
+            return
+        for path, f_state in state.get("files", {}).items():
+            migrate_file_state(path, f_state)
+        tmp = STATE_FILE.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, STATE_FILE)
+
+
+def _pack(text: str):
+    data = text.encode("utf-8")
+    if len(data) >= COMPRESS_MIN:
+        return zlib.compress(data, 6), 1
+    return data, 0
+
+
+def _unpack(blob, compressed) -> str:
+    return (zlib.decompress(blob) if compressed else bytes(blob)).decode("utf-8")
+
+
+def _now():
+    return datetime.now(UTC).isoformat()
+
+
+def append_messages(file: str, messages):
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "INSERT INTO messages (file, role, content, compressed, ts) VALUES (?, ?, ?, ?, ?)",
+            [(file, m["role"], *_pack(m["content"]), _now()) for m in messages],
+        )
+
+
+def count_messages(file: str) -> int:
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM messages WHERE file = ?", (file,)).fetchone()[0]
+
+
+def recent_messages(file: str, limit: int):
+    """The last `limit` messages for `file`, oldest first."""
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT role, content, compressed FROM messages WHERE file = ? ORDER BY id DESC LIMIT ?",
+            (file, limit),
+        ).fetchall()
+    return [{"role": role, "content": _unpack(blob, z)} for role, blob, z in reversed(rows)]
+
+
+def iter_messages(file: str, page_size: int):
+    """Yields the full history for `file` one page at a time."""
+    last_id = 0
+    while True:
+        with closing(_connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, role, content, compressed, ts FROM messages WHERE file = ? AND id > ? ORDER BY id LIMIT ?",
+                (file, last_id, page_size),
+            ).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [{"role": role, "content": _unpack(blob, z), "timestamp": ts} for _, role, blob, z, ts in rows]
+
+
+def set_pending_plan(file: str, goal: str, content: str):
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM plans WHERE file = ? AND saved = 0", (file,))
+        conn.execute(
+            "INSERT INTO plans (file, goal, content, compressed, saved, ts) VALUES (?, ?, ?, ?, 0, ?)",
+            (file, goal, *_pack(content), _now()),
+        )
+
+
+def save_pending_plan(file: str):
+    """Marks the pending plan as saved; returns its goal, or None if there was none."""
+    with closing(_connect()) as conn, conn:
+        row = conn.execute("SELECT id, goal FROM plans WHERE file = ? AND saved = 0", (file,)).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE plans SET saved = 1 WHERE id = ?", (row[0],))
+        return row[1]
+
+
+def add_saved_plan(file: str, goal: str, content: str, ts: str = None):
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT INTO plans (file, goal, content, compressed, saved, ts) VALUES (?, ?, ?, ?, 1, ?)",
+            (file, goal, *_pack(content), ts or _now()),
+        )
+
+
+def count_plans(file: str) -> int:
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM plans WHERE file = ? AND saved = 1", (file,)).fetchone()[0]
+
+
+def get_plans(file: str, offset: int = 0, limit: int = -1):
+    """Saved plans for `file` in the order they were saved (LIMIT -1 means all)."""
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT id, goal, content, compressed, ts FROM plans WHERE file = ? AND saved = 1 ORDER BY id LIMIT ? OFFSET ?",
+            (file, limit, offset),
+        ).fetchall()
+    return [{"id": pid, "goal": goal, "content": _unpack(blob, z), "timestamp": ts} for pid, goal, blob, z, ts in rows]
+
+
+def migrate_file_state(file: str, f_state) -> bool:
+    """Moves inline chat history and plans from a state.json file entry into the store."""
+    moved = False
+    if f_state.get("chat_history"):
+        append_messages(file, f_state["chat_history"])
+        moved = True
+    for plan in f_state.get("plans") or []:
+        add_saved_plan(file, plan["goal"], plan["content"], plan.get("timestamp"))
+        moved = True
+    if f_state.get("pending_plan"):
+        pending = f_state["pending_plan"]
+        set_pending_plan(file, pending["goal"], pending["content"])
+        moved = True
+    for key in INLINE_KEYS:
+        if key in f_state:
+            del f_state[key]
+            moved = True
+    return moved
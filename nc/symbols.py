@@ -0,0 +1,107 @@
+import ast
+import hashlib
+
+
+def index_symbols(text: str):
+    """Function and class definitions (nested ones dotted) with their line spans."""
+    try:
+        tree = ast.parse(text)
+    except SyntaxError:
+        return []
+
+    symbols = []
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = f"{prefix}{child.name}"
+                symbols.append({
+                    "name": name,
+                    "kind": "class" if isinstance(child, ast.ClassDef) else "def",
+                    "line": child.lineno,
+                    "end": child.end_lineno,
+                })
+                visit(child, name + ".")
+
+    visit(tree, "")
+    return symbols
+
+
+def _callees(node):
+    names = set()
+    for sub in ast.walk(node):
+        if isinstance(sub, ast.Call):
+            if isinstance(sub.func, ast.Name):
+                names.add(sub.func.id)
+            elif isinstance(sub.func, ast.Attribute):
+                names.add(sub.func.attr)
+    return sorted(names)
+
+
+def module_residue(lines, covered):
+    """Module-level source: the lines outside `covered`, without blank ones,
+    so spacing between definitions doesn't count as a change."""
+    return "\n".join(l for n, l in enumerate(lines, start=1) if n not in covered and l.strip())
+
+
+def code_units(text: str):
+    """Splits a module into hashable units: top-level functions, methods of
+    top-level classes, and a "<module>" unit for every other line.
+
+    Returns None if the text does not parse.
+    """
+    try:
+        tree = ast.parse(text)
+    except SyntaxError:
+        return None
+
+    lines = text.splitlines()
+    units, covered = [], set()
+
+    def add(node, name):
+        start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+        source = "\n".join(lines[start - 1:node.end_lineno])
+        units.append({
+            "name": name,
+            "line": start,
+            "end": node.end_lineno,
+            "hash": hashlib.sha256(source.encode()).hexdigest(),
+            "signature": "\n".join(lines[node.lineno - 1:node.body[0].lineno - 1]).strip() or lines[node.lineno - 1],
+            "calls": _callees(node),
+        })
+        covered.update(range(start, node.end_lineno + 1))
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            add(node, node.name)
+        elif isinstance(node, ast.ClassDef):
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    add(child, f"{node.name}.{child.name}")
+
+    rest = module_residue(lines, covered)
+    units.append({
+        "name": "<module>", "line": 1, "end": len(lines),
+        "hash": hashlib.sha256(rest.encode()).hexdigest(), "signature": "", "calls": [],
+    })
+    return units
+
+
+def changed_units(old_hashes, units):
+    """Names of units that are new or whose source changed since `old_hashes`."""
+    return [u["name"] for u in units if old_hashes.get(u["name"]) != u["hash"]]
+
+
+def unit_excerpt(text: str, units, names):
+    """Source of the named units plus the signatures of their callers, for a partial prompt."""
+    lines = text.splitlines()
+    wanted = set(names)
+    short = {n.rsplit(".", 1)[-1] for n in wanted}
+    parts = []
+    for u in units:
+        if u["name"] in wanted and u["name"] != "<module>":
+            parts.append(f"# {u['name']} (lines {u['line']}-{u['end']})\n" + "\n".join(lines[u["line"] - 1:u["end"]]))
+    for u in units:
+        if u["name"] not in wanted and short & set(u["calls"]):
+            parts.append(f"# caller: {u['name']} (line {u['line']}), body unchanged\n{u['signature']}")
+    return "\n\n".join(parts)
@@ -0,0 +1,144 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from .lock import data_lock
+
+TELEMETRY_FILE = Path(".nc/telemetry.json")
+
+# Seconds; the last bucket is +Inf
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HELP = {
+    "nc_command_duration_seconds": "Wall time of nc commands",
+    "nc_llm_request_duration_seconds": "Wall time of model requests",
+    "nc_llm_requests_total": "Model requests sent",
+    "nc_llm_tokens_total": "Tokens processed by the model",
+    "nc_llm_prompt_size_unknown_total": "Early-stopped requests whose prompt tokens the server did not report",
+    "nc_edit_attempts_total": "Edit generations, including retries",
+    "nc_edit_retries_total": "Edit generations after the first for one request",
+    "nc_verify_rejections_total": "Generated diffs rejected by the verifier",
+    "nc_apply_total": "Diff applications by result",
+    "nc_test_runs_total": "Impacted-test runs after apply, per test file, by result",
+}
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{k}="{esc(v)}"' for k, v in sorted(labels.items()))
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batch():
+    """Collects this thread's count/observe calls and writes them in one update."""
+    if getattr(_batch, "ops", None) is not None:
+        yield
+        return
+    _batch.ops = []
+    try:
+        yield
+    finally:
+        ops, _batch.ops = _batch.ops, None
+        if ops:
+            _update(lambda data: [op(data) for op in ops])
+
+
+def _update(fn):
+    ops = getattr(_batch, "ops", None)
+    if ops is not None:
+        ops.append(fn)
+        return
+    if not TELEMETRY_FILE.parent.exists():
+        return
+    with data_lock():
+        data = load()
+        fn(data)
+        tmp = TELEMETRY_FILE.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, TELEMETRY_FILE)
+
+
+def load():
+    if not TELEMETRY_FILE.exists():
+        return {"counters": {}, "histograms": {}}
+    with open(TELEMETRY_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def count(name, labels=None, value=1):
+    def apply(data):
+        series = data["counters"].setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+    _update(apply)
+
+
+def observe(name, seconds, labels=None):
+    def apply(data):
+        h = data["histograms"].setdefault(name, {}).setdefault(
+            _labels(labels), {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0},
+        )
+        i = next((i for i, b in enumerate(BUCKETS) if seconds <= b), len(BUCKETS))
+        h["buckets"][i] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+    _update(apply)
+
+
+def render() -> str:
+    """nc's own series in the Prometheus text format."""
+    data = load()
+    out = []
+    for name, series in sorted(data["counters"].items()):
+        out += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+        for key, value in sorted(series.items()):
+            out.append(f"{name}{{{key}}} {value}" if key else f"{name} {value}")
+    for name, series in sorted(data["histograms"].items()):
+        out += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+        for key, h in sorted(series.items()):
+            sep = "," if key else ""
+            cumulative = 0
+            for bound, n in zip(list(BUCKETS) + ["+Inf"], h["buckets"]):
+                cumulative += n
+                out.append(f'{name}_bucket{{{key}{sep}le="{bound}"}} {cumulative}')
+            out.append(f"{name}_sum{{{key}}} {h['sum']}" if key else f"{name}_sum {h['sum']}")
+            out.append(f"{name}_count{{{key}}} {h['count']}" if key else f"{name}_count {h['count']}")
+    return "\n".join(out) + "\n"
+
+
+def merge_server_metrics(payloads) -> str:
+    """Merges llama-server /metrics payloads ({server name: text}) into one exposition.
+
+    Every sample gets a server="<name>" label, and each family's samples stay
+    together under a single HELP/TYPE header.
+    """
+    families = {}
+    for server, text in payloads.items():
+        family = None
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith("#"):
+                parts = line.split(maxsplit=3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    meta = families.setdefault(family, {"meta": {}, "samples": []})["meta"]
+                    meta.setdefault(parts[1], line)
+                continue
+            name, _, value = line.partition(" ")
+            metric, brace, labels = name.partition("{")
+            name = f'{metric}{{server="{server}"' + (f",{labels}" if brace else "}")
+            families.setdefault(family or metric, {"meta": {}, "samples": []})["samples"].append(f"{name} {value}")
+
+    out = []
+    for fam in families.values():
+        out += [fam["meta"][k] for k in ("HELP", "TYPE") if k in fam["meta"]] + fam["samples"]
+    return "\n".join(out) + ("\n" if out else "")
@@ -1,10 +1,50 @@
+import re
 import sys
+import importlib
 from pathlib import Path
 
+from .diff_utils import PLACEHOLDER_RE
 
-from rich.console import Console
 
-console = Console()
+class _LazyConsole:
+    """Builds the shared rich Console on first use; importing rich dominates nc's startup."""
+
+    _console = None
+    _stderr = False
+
+    def __getattr__(self, name):
+        if _LazyConsole._console is None:
+            from rich.console import Console
+            _LazyConsole._console = Console(stderr=_LazyConsole._stderr)
+        return getattr(_LazyConsole._console, name)
+
+
+def console_to_stderr():
+    """Sends all console output (status, warnings, panels) to stderr, keeping stdout for results."""
+    _LazyConsole._stderr = True
+    if _LazyConsole._console is not None:
+        _LazyConsole._console.stderr = True
+
+
+console = _LazyConsole()
+
+
+class _LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            # import_module holds the import lock, so first use from a worker thread is safe
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_import(name: str):
+    """Returns a stand-in for module `name` that imports it on first attribute access."""
+    return sys.modules.get(name) or _LazyModule(name)
+
 
 def die(msg):
     console.print(f"[bold red]nc: error:[/bold red] {msg}", style="red")
@@ -19,70 +59,148 @@ def read_text_file(path: Path) -> str:
         return data.decode("utf-16")
 
 
+_SKIP_RE = re.compile(r"RULES:|INSTRUCTIONS:|IMPORTANT:|OUTPUT FORMAT:|CRITICAL:|FILE:", re.IGNORECASE)
+DIFF_MARKERS = ("--- a/", "+++ b/", "@@ -", "diff --git")
+CODE_MARKERS = ("def ", "import ", "class ", "print(", "if __name__")
+
+
+class ResponseParser:
+    """Single-pass, incremental model response parser.
+
+    Feed streamed text with `feed()`; `finish()` returns the same
+    (preamble, contents) shape as `split_response`. `done` turns true as soon as
+    a complete diff block has closed or a diff contains placeholder text, so a
+    streaming caller can stop generating there.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self.lines = []
+        self.preamble = []
+        self.contents = []
+        self._block = None
+        self._block_type = 'text'
+        self.saw_fence = False
+        self.raw_diff_start = -1
+        self.complete_diff = False
+        self.placeholder = False
+
+    @property
+    def done(self):
+        return self.complete_diff or self.placeholder
+
+    def feed(self, chunk: str) -> bool:
+        self._partial += chunk
+        if "\n" in self._partial:
+            *complete, self._partial = self._partial.split("\n")
+            for line in complete:
+                self._line(line)
+        return self.done
+
+    def _line(self, line: str):
+        line = line.rstrip("\r")
+        # Filter out repeated instructions/rules that some models echo back
+        if _SKIP_RE.search(line):
+            return
+
+        self.lines.append(line)
+        if "```" in line:
+            self.saw_fence = True
+        elif self.raw_diff_start == -1 and line.startswith(DIFF_MARKERS):
+            self.raw_diff_start = len(self.lines) - 1
+
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            if self._block is not None:
+                block = "\n".join(self._block)
+                self.contents.append((self._block_type, block))
+                if self._block_type in ('diff', 'code') and "@@ " in block and not PLACEHOLDER_RE.search(block):
+                    self.complete_diff = True
+                self._block = None
+            else:
+                self._block = []
+                lang = stripped[3:].strip().lower()
+                self._block_type = 'diff' if lang in ('diff', 'udiff', 'patch') else 'code'
+            return
+
+        if self._block is not None:
+            self._block.append(line)
+            if self._block_type == 'diff' and PLACEHOLDER_RE.search(line):
+                self.placeholder = True
+        elif not self.contents:
+            self.preamble.append(line)
+            if self.raw_diff_start != -1 and not self.saw_fence and PLACEHOLDER_RE.search(line):
+                self.placeholder = True
+        elif self.contents[-1][0] == 'text':
+            self.contents[-1][1].append(line)
+        else:
+            self.contents.append(('text', [line]))
+
+    def finish(self):
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+
+        lines = self.lines
+
+        # 1. Raw diff without backticks
+        if self.raw_diff_start != -1 and not self.saw_fence:
+            start = self.raw_diff_start
+            if start > 0:
+                return "\n".join(lines[:start]).strip(), [('diff', "\n".join(lines[start:]))]
+            return "", [('diff', "\n".join(lines))]
+
+        # 2. Triple-backtick blocks, with text runs joined once here
+        contents = [(ctype, "\n".join(body) if ctype == 'text' else body) for ctype, body in self.contents]
+        if self._block:
+            contents.append((self._block_type, "\n".join(self._block)))
+
+        # 3. Fallback: If no blocks found, but preamble contains what looks like code
+        if not contents:
+            code_start = next((idx for idx, l in enumerate(self.preamble) if l.startswith(CODE_MARKERS)), -1)
+            if code_start != -1:
+                real_preamble = "\n".join(self.preamble[:code_start]).strip()
+                code_content = "\n".join(self.preamble[code_start:]).strip()
+                return real_preamble, [('code', code_content)]
+
+        return "\n".join(self.preamble).strip(), contents
+
+
 def split_response(text: str):
     """Splits model response into preamble and code/diff blocks."""
-    # Filter out repeated instructions/rules that some models echo back
-    filtered_lines = []
-    skip_keywords = ("RULES:", "INSTRUCTIONS:", "IMPORTANT:", "OUTPUT FORMAT:", "CRITICAL:", "FILE:")
+    parser = ResponseParser()
+    parser.feed(text)
+    return parser.finish()
+
+
+_CHECK_ITEM_RE = re.compile(r"^(\s*)(?:[-*+]\s+\[[ xX]\]|\d+[.)]\s+\[[ xX]\])\s*(.+)$")
+_LIST_ITEM_RE = re.compile(r"^(\s*)(?:[-*+]|\d+[.)])\s+(.+)$")
+
+
+def parse_checklist(text: str):
+    """Steps of a Markdown plan: the outermost checklist items, with nested
+    items folded into their step. Plain bullet/numbered lists are used when
+    the plan has no checkboxes. Items inside code fences are ignored.
+    """
+    lines, in_fence = [], False
     for line in text.splitlines():
-        if any(kw in line.upper() for kw in skip_keywords):
-            continue
-        filtered_lines.append(line)
-    
-    lines = filtered_lines
-    preamble, contents = [], []
-    
-    # 1. Check for raw diff without backticks
-    diff_markers = ("--- a/", "+++ b/", "@@ -", "diff --git")
-    text_processed = "\n".join(lines)
-    if any(line.startswith(diff_markers) for line in lines) and "```" not in text_processed:
-        diff_start = next((idx for idx, l in enumerate(lines) if any(l.startswith(m) for m in diff_markers)), -1)
-        if diff_start > 0:
-            return "\n".join(lines[:diff_start]).strip(), [('diff', "\n".join(lines[diff_start:]))]
-        return "", [('diff', text_processed)]
-
-    # 2. Standard triple-backtick block parsing
-    i, in_block, current_block, block_type = 0, False, [], 'text'
-    while i < len(lines):
-        line = lines[i]
-        if line.strip().startswith("```"):
-            if in_block:
-                contents.append((block_type, "\n".join(current_block)))
-                current_block, in_block = [], False
-            else:
-                in_block = True
-                lang = line.strip()[3:].strip().lower()
-                block_type = 'diff' if lang in ('diff', 'udiff', 'patch') else 'code'
-            i += 1
-            continue
-        
-        if in_block:
-            current_block.append(line)
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        elif not in_fence:
+            lines.append(line)
+
+    for item_re in (_CHECK_ITEM_RE, _LIST_ITEM_RE):
+        items = [(len(m.group(1).expandtabs(4)), m.group(2).strip()) for m in map(item_re.match, lines) if m]
+        if items:
+            break
+    else:
+        return []
+
+    top = min(indent for indent, _ in items)
+    steps = []
+    for indent, body in items:
+        if indent == top or not steps:
+            steps.append(body)
         else:
-            if not contents:
-                preamble.append(line)
-            else:
-                if contents[-1][0] == 'text':
-                    contents[-1] = ('text', contents[-1][1] + "\n" + line)
-                else:
-                    contents.append(('text', line))
-        i += 1
-        
-    if in_block and current_block:
-        contents.append((block_type, "\n".join(current_block)))
-        
-    # 3. Fallback: If no blocks found, but preamble contains what looks like code
-    if not contents and not any(ctype in ('code', 'diff') for ctype, _ in contents):
-        code_markers = ("def ", "import ", "class ", "print(", "if __name__")
-        code_start = -1
-        for idx, line in enumerate(preamble):
-            if any(line.startswith(m) for m in code_markers):
-                code_start = idx
-                break
-        
-        if code_start != -1:
-            real_preamble = "\n".join(preamble[:code_start]).strip()
-            code_content = "\n".join(preamble[code_start:]).strip()
-            return real_preamble, [('code', code_content)]
-
-    return "\n".join(preamble).strip(), contents
+            steps[-1] += f"\n  - {body}"
+    return steps
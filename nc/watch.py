@@ -0,0 +1,115 @@
+import os
+import sys
+import struct
+import select
+import threading
+import ctypes
+import ctypes.util
+from pathlib import Path
+
+IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x8, 0x80, 0x100
+_EVENT = struct.Struct("iIII")
+
+
+def _inotify():
+    """Returns libc if inotify is usable on this platform, else None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+class FileWatcher(threading.Thread):
+    """Calls `on_change(path)` from a background thread whenever a watched file is saved.
+
+    `paths_fn` is re-evaluated every `interval` seconds so newly opened files are
+    picked up. Uses inotify on Linux and falls back to polling mtimes elsewhere.
+    """
+
+    def __init__(self, paths_fn, on_change, interval=0.5):
+        super().__init__(daemon=True, name="nc-watch")
+        self.paths_fn = paths_fn
+        self.on_change = on_change
+        self.interval = interval
+        self._stopped = threading.Event()
+        self.backend = "inotify" if _inotify() else "polling"
+
+    def stop(self):
+        self._stopped.set()
+
+    def _paths(self):
+        try:
+            return {Path(p).resolve() for p in self.paths_fn()}
+        except Exception:
+            return set()
+
+    def _fire(self, path):
+        try:
+            self.on_change(path)
+        except Exception:
+            # A failed refresh must never kill the watcher thread
+            pass
+
+    def run(self):
+        if self.backend == "inotify":
+            self._run_inotify()
+        else:
+            self._run_polling()
+
+    def _run_polling(self):
+        def stat(p):
+            try:
+                st = p.stat()
+                return st.st_mtime_ns, st.st_size
+            except OSError:
+                return None
+
+        seen = {p: stat(p) for p in self._paths()}
+        while not self._stopped.wait(self.interval):
+            for p in self._paths():
+                current = stat(p)
+                if p in seen and current is not None and current != seen[p]:
+                    self._fire(p)
+                seen[p] = current
+
+    def _run_inotify(self):
+        libc = _inotify()
+        fd = libc.inotify_init1(os.O_NONBLOCK)
+        if fd < 0:
+            self.backend = "polling"
+            return self._run_polling()
+
+        # Watch parent directories: editors often save via write-to-temp + rename
+        dirs = {}
+        try:
+            while not self._stopped.is_set():
+                watched = self._paths()
+                for d in {p.parent for p in watched} - set(dirs.values()):
+                    wd = libc.inotify_add_watch(fd, str(d).encode(), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+                    if wd >= 0:
+                        dirs[wd] = d
+
+                ready, _, _ = select.select([fd], [], [], self.interval)
+                if not ready:
+                    continue
+                try:
+                    buf = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+
+                changed, offset = set(), 0
+                while offset + _EVENT.size <= len(buf):
+                    wd, mask, _, length = _EVENT.unpack_from(buf, offset)
+                    name = buf[offset + _EVENT.size: offset + _EVENT.size + length].rstrip(b"\0")
+                    offset += _EVENT.size + length
+                    if wd in dirs and name:
+                        p = dirs[wd] / os.fsdecode(name)
+                        if p in watched:
+                            changed.add(p)
+                for p in changed:
+                    self._fire(p)
+        finally:
+            os.close(fd)
@@ -0,0 +1,28 @@
+from nc.llm import FIX_SENTINEL, fix_is_clean, stop_on_phrase
+
+
+def feed(chunks):
+    """Feeds `chunks` to a fix sentinel stop; returns the text generated until it fired."""
+    stop, out = stop_on_phrase(FIX_SENTINEL), ""
+    for chunk in chunks:
+        out += chunk
+        if stop(chunk):
+            break
+    return out
+
+
+def test_sentinel_stops_a_clean_response():
+    out = feed(["**No err", "ors detected", ".** Looks fine", " to me."])
+    assert out == "**No errors detected"
+    assert fix_is_clean(out)
+
+
+def test_sentinel_inside_a_finding_is_ignored():
+    finding = [
+        "Bug on line 4: `divide` swaps its arguments, so the caller's ",
+        "check that prints \"No errors detected\" never runs.\n",
+        "```diff\n--- a/x.py\n+++ b/x.py\n@@ -4 +4 @@\n-    return b / a\n+    return a / b\n```\n",
+    ]
+    out = feed(finding)
+    assert out == "".join(finding)
+    assert not fix_is_clean(out)
@@ -0,0 +1,72 @@
+import json
+import importlib
+
+import pytest
+
+import nc
+
+llm = importlib.import_module("nc.llm")
+
+SOURCE = "def f():\n    return 1\n"
+DIFF = "```diff\n--- a/sample.py\n+++ b/sample.py\n@@ -1,2 +1,2 @@\n def f():\n-    return 1\n+    return 2\n```\n"
+METRICS = {"completion_tokens": 10, "prompt_tokens": 50, "duration": 0.1, "tokens_per_sec": 100.0}
+
+
+class FakeProcess:
+    def __init__(self, pid):
+        self.pid = pid
+
+
+@pytest.fixture
+def launches(tmp_path, monkeypatch):
+    """A workspace with sample.py open and a fake llama-server; yields the launch log."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".nc").mkdir()
+    path = (tmp_path / "sample.py").resolve()
+    path.write_text(SOURCE, encoding="utf-8")
+    (tmp_path / ".nc" / "state.json").write_text(json.dumps({
+        "open_file": str(path), "file_hash": nc.compute_hash(path), "files": {}, "servers": {},
+    }))
+
+    started = []
+
+    def start_server(model_path=None, ctx_size=None, embedding=False, parallel=None, profile=None):
+        started.append({"ctx": ctx_size, "slots": parallel})
+        return FakeProcess(90000 + len(started)), 8000 + len(started)
+
+    def run_edit_llm(port, text, instruction, on_text=None, **kwargs):
+        if on_text:
+            on_text(DIFF)
+        return DIFF, dict(METRICS)
+
+    monkeypatch.setattr(llm, "start_server", start_server)
+    monkeypatch.setattr(llm, "server_alive", lambda port: port in {8000 + i for i in range(1, len(started) + 1)})
+    monkeypatch.setattr(llm, "server_busy", lambda port: False)
+    monkeypatch.setattr(llm, "run_edit_llm", run_edit_llm)
+    monkeypatch.setattr(llm, "get_confidence_score", lambda *a, **k: (95, "ok"))
+    monkeypatch.setattr(nc, "_stop_server", lambda pid: pytest.fail(f"server {pid} was stopped"))
+    monkeypatch.setattr(nc, "show_diff", lambda *a, **k: None)
+    return started
+
+
+def ask_port():
+    """The server an `ask` about sample.py goes to."""
+    return nc.server_port(nc.load_state(), "ask", f"FILE:\n{SOURCE}\n\nQUESTION:\nwhat does f return?")
+
+
+def test_ask_after_best_of_reuses_the_server(launches):
+    nc.cmd_edit("--best 4 return 2 instead")
+    assert [l["slots"] for l in launches] == [4]
+
+    assert ask_port() == 8001
+    assert len(launches) == 1
+
+
+def test_parallel_run_grows_a_single_slot_server(launches, monkeypatch):
+    ask_port()
+    stopped = []
+    monkeypatch.setattr(nc, "_stop_server", lambda pid: stopped.append(pid) or True)
+
+    nc.cmd_edit("--best 4 return 2 instead")
+    assert [l["slots"] for l in launches] == [1, 4]
+    assert stopped == [90001]